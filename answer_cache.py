@@ -0,0 +1,142 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import timed, answer_cache_events
+
+logger = logging.getLogger(__name__)
+
+# Questions that lean on the conversation so far ("explain that again")
+# and so cannot be answered from another student's exchange
+FOLLOW_UP = re.compile(
+    r"\b(it|its|that|those|they|them|their|again|more|else|previous|earlier|above|you said|last one)\b",
+    re.IGNORECASE
+)
+
+class _DocumentAnswers:
+    def __init__(self):
+        self.questions = []
+        self.answers = []
+        self.embeddings = None
+        self.last_used = []
+
+    def find(self, embedding, threshold, tick):
+        if self.embeddings is None:
+            return None
+        scores = self.embeddings @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        self.last_used[best] = tick
+        return self.answers[best]
+
+    def add(self, question, embedding, answer, tick, max_answers):
+        """
+        Add an answer, replacing the least recently used one when full.
+        Returns how many answers were evicted
+        """
+        if self.embeddings is not None and len(self.answers) >= max_answers:
+            oldest = int(np.argmin(self.last_used))
+            self.questions[oldest] = question
+            self.answers[oldest] = answer
+            self.embeddings[oldest] = embedding
+            self.last_used[oldest] = tick
+            return 1
+
+        self.questions.append(question)
+        self.answers.append(answer)
+        self.last_used.append(tick)
+        row = embedding[np.newaxis, :]
+        self.embeddings = row if self.embeddings is None else np.concatenate([self.embeddings, row])
+        return 0
+
+class AnswerCache:
+    """
+    Per-document semantic cache of chat answers: a question close enough
+    to one already answered for the same document gets the stored answer
+    """
+    def __init__(self, threshold=0.92, max_documents=256, max_answers=200):
+        self.threshold = threshold
+        self.max_documents = max_documents
+        self.max_answers = max_answers
+        self.enabled = max_answers > 0
+        self._documents = OrderedDict()
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    def cacheable(self, question, history_context):
+        """
+        Whether a shared answer may be looked up: either there is no
+        conversation yet, or the question does not refer back to it
+        """
+        if not self.enabled:
+            return False
+        return not history_context or not FOLLOW_UP.search(question)
+
+    def storable(self, history_context):
+        """
+        Whether a fresh answer may be shared with other students. Only
+        answers generated without any conversation in the prompt are, so
+        one student's exchange never reaches another
+        """
+        return self.enabled and not history_context
+
+    def embed(self, model, question):
+        with timed('embed'):
+            embedding = model.encode([question], normalize_embeddings=True)[0]
+        return np.asarray(embedding, dtype=np.float32)
+
+    def lookup(self, document_key, embedding):
+        with self._lock:
+            self._tick += 1
+            answers = self._documents.get(document_key)
+            answer = answers.find(embedding, self.threshold, self._tick) if answers else None
+            if answers:
+                self._documents.move_to_end(document_key)
+
+        if answer is not None:
+            logger.debug("Answer cache hit for document %s", document_key[:12])
+        answer_cache_events.inc('hit' if answer is not None else 'miss')
+        return answer
+
+    def store(self, document_key, question, embedding, answer):
+        with self._lock:
+            self._tick += 1
+            answers = self._documents.get(document_key)
+            if answers is None:
+                answers = self._documents[document_key] = _DocumentAnswers()
+                if len(self._documents) > self.max_documents:
+                    self._documents.popitem(last=False)
+            else:
+                self._documents.move_to_end(document_key)
+            evicted = answers.add(question, embedding, answer, self._tick, self.max_answers)
+
+        answer_cache_events.inc('store')
+        if evicted:
+            answer_cache_events.inc('evict', evicted)
+
+    def stats(self):
+        events = answer_cache_events.snapshot()
+        lookups = events.get('hit', 0) + events.get('miss', 0)
+        with self._lock:
+            entries = sum(len(answers.answers) for answers in self._documents.values())
+            documents = len(self._documents)
+        return {
+            'hits': events.get('hit', 0),
+            'misses': events.get('miss', 0),
+            'hit_rate': round(events.get('hit', 0) / lookups, 3) if lookups else None,
+            'stores': events.get('store', 0),
+            'evictions': events.get('evict', 0),
+            'documents': documents,
+            'entries': entries
+        }
+
+def create_answer_cache(config):
+    return AnswerCache(
+        threshold=config.get('ANSWER_CACHE_THRESHOLD', 0.92),
+        max_documents=config.get('ANSWER_CACHE_DOCUMENTS', 256),
+        max_answers=config.get('ANSWER_CACHE_SIZE', 200)
+    )
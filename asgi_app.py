@@ -0,0 +1,177 @@
+"""
+ASGI entry point.
+
+Threading model: every request goes through the Flask app as usual
+(routing, hooks, sessions, error handlers) on a pool of WEB_THREADS
+threads. A view whose reply waits on a backend (Gemini, speech
+recognition, TTS, a document change) returns an AsyncResponse: the
+thread is released once the view returns, and the reply is awaited and
+streamed on the event loop, so a waiting request holds no thread.
+Blocking work inside a reply goes to worker threads (asyncio.to_thread
+or the backend's own pool, see backend_limits). Under a plain WSGI
+server the same replies are run on a shared event loop while the
+request's thread waits (async_utils), so each path has one async
+implementation either way.
+
+    uvicorn --factory asgi_app:create_asgi_app
+"""
+import os
+import asyncio
+import logging
+
+from flask import Response, current_app, got_request_exception
+from werkzeug.exceptions import HTTPException, InternalServerError
+
+from async_utils import use_loop, run_blocking, iter_blocking
+from stream_utils import SSE_HEADERS
+
+logger = logging.getLogger(__name__)
+
+# WSGI environ key under which the front collects responses to finish
+FRONT_KEY = 'asgi_app.replies'
+
+def _is_async(body):
+    return hasattr(body, '__aiter__')
+
+class AsyncResponse(Response):
+    """
+    Response finished on the event loop. reply is a coroutine returning
+    what a view would; its status, headers and body replace this
+    response's once awaited. Either body may be an async iterator
+    """
+    def __init__(self, response=None, reply=None, **kwargs):
+        super().__init__(response, **kwargs)
+        self.reply = reply
+
+    async def resolve(self):
+        if self.reply is None:
+            return
+        reply, self.reply = self.reply, None
+
+        try:
+            reply = current_app.make_response(await reply)
+        except HTTPException as e:
+            reply = e.get_response()
+        except Exception as e:
+            logger.exception("Error in async reply")
+            got_request_exception.send(current_app._get_current_object(), exception=e)
+            reply = InternalServerError().get_response()
+
+        self.status_code = reply.status_code
+        self.headers.update(reply.headers)
+        self.response = reply.response
+
+    def __call__(self, environ, start_response):
+        replies = environ.get(FRONT_KEY)
+        if replies is not None:
+            replies.append((self, environ))
+            return []
+
+        run_blocking(self.resolve())
+        if _is_async(self.response):
+            self.response = iter_blocking(self.response)
+        return super().__call__(environ, start_response)
+
+def event_stream(events):
+    """
+    Server-sent events response: events is an async generator of
+    sse_event() strings
+    """
+    return AsyncResponse(events, mimetype='text/event-stream', headers=SSE_HEADERS)
+
+class AsyncFront:
+    """
+    ASGI app running the Flask app on a thread pool and finishing its
+    AsyncResponses on the event loop
+    """
+    def __init__(self, app, threads=64):
+        from a2wsgi import WSGIMiddleware
+
+        self.app = app
+        self.wsgi = WSGIMiddleware(self._handle, workers=threads)
+
+    def _handle(self, environ, start_response):
+        environ[FRONT_KEY] = environ['asgi.scope'][FRONT_KEY]
+        return self.app(environ, start_response)
+
+    async def __call__(self, scope, receive, send):
+        use_loop(asyncio.get_running_loop())
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return await self.wsgi(scope, receive, send)
+
+        replies = []
+
+        async def send_unless_deferred(message):
+            if not replies:
+                await send(message)
+
+        await self.wsgi(dict(scope, **{FRONT_KEY: replies}), receive, send_unless_deferred)
+        if replies:
+            response, environ = replies[0]
+            await self._finish(response, environ, receive, send)
+
+    async def _finish(self, response, environ, receive, send):
+        with self.app.app_context():
+            await response.resolve()
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': [
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.get_wsgi_headers(environ).items()
+                ]
+            })
+            if _is_async(response.response):
+                await self._stream(response.response, environ['PATH_INFO'], receive, send)
+            else:
+                await send({'type': 'http.response.body', 'body': b''.join(response.get_app_iter(environ))})
+
+    async def _stream(self, body, path, receive, send):
+        """
+        Send the body as it is produced, stopping it if the client goes
+        away first
+        """
+        async def produce():
+            try:
+                async for chunk in body:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            finally:
+                await body.aclose()
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        producer = asyncio.ensure_future(produce())
+        watcher = asyncio.ensure_future(disconnected())
+        try:
+            await asyncio.wait((producer, watcher), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+            if not producer.done():
+                logger.debug("Client left %s before the stream finished", path)
+                producer.cancel()
+            result, = await asyncio.gather(producer, return_exceptions=True)
+            if isinstance(result, Exception):
+                logger.error("Error streaming %s: %s", path, result)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+def create_asgi_app():
+    """
+    Build the Flask app and serve it through the ASGI front
+    """
+    from upload_app import create_app
+    return AsyncFront(create_app(), threads=int(os.getenv('WEB_THREADS', 64)))
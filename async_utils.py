@@ -0,0 +1,61 @@
+"""
+Drive async code from synchronous callers on one shared event loop: the
+server's under the ASGI front, otherwise one started on first use.
+"""
+import asyncio
+import threading
+
+_loop = None
+_own_loop = None
+_lock = threading.Lock()
+
+def use_loop(loop):
+    """
+    Run coroutines from synchronous code on loop, the server's event loop,
+    so loop-bound clients are only ever used from one loop
+    """
+    global _loop
+    _loop = loop
+
+def event_loop():
+    global _own_loop
+    loop = _loop
+    if loop is not None and loop.is_running():
+        return loop
+
+    with _lock:
+        if _own_loop is None:
+            _own_loop = asyncio.new_event_loop()
+            threading.Thread(target=_own_loop.run_forever, name='event-loop', daemon=True).start()
+        return _own_loop
+
+def run_blocking(coroutine):
+    """
+    Run coroutine on the shared loop and return its result. The caller's
+    context variables are carried over. Must not be called from a thread
+    that is running an event loop
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run_coroutine_threadsafe(coroutine, event_loop()).result()
+    coroutine.close()
+    raise RuntimeError("run_blocking() called from a running event loop")
+
+async def _next(generator):
+    return await generator.__anext__()
+
+def iter_blocking(generator):
+    """
+    Iterate an async generator from synchronous code, one item at a time.
+    Closing the iterator closes the generator
+    """
+    try:
+        while True:
+            try:
+                item = run_blocking(_next(generator))
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        run_blocking(generator.aclose())
@@ -1,162 +1,248 @@
 import os
+import re
 import uuid
-import tempfile
-from flask import request, jsonify, url_for, session, redirect
-import speech_recognition as sr
-import google.generativeai as genai
-from sentence_transformers import SentenceTransformer, util
-import numpy as np
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
+import asyncio
+import logging
+from flask import request, jsonify, url_for, session, redirect, Response
 
-from document_utils import get_document_data
+from document_utils import (
+    get_document_data, get_document_field, get_document_version, wait_for_change, document_key
+)
+from retrieval_utils import build_context
+from model_registry import get_sentence_model
+from stream_utils import sse_event
+from history_store import create_history_store
+from answer_cache import create_answer_cache
+from speech_utils import transcribe
+from prompt_utils import record_prompt
+from llm_client import get_llm_client
+from backend_limits import run_limited
+from asgi_app import AsyncResponse, event_stream
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+APOLOGY = "I'm sorry, I couldn't process your request right now."
+
+def build_chat_prompt(prompt, document_content=None, history_context=""):
+    if document_content and document_content.strip():
+        return f"""
+            Document Content: {document_content}
+            
+            {history_context}
+            
+            User says: {prompt}
+            
+            You are a helpful, friendly AI assistant having a natural conversation. 
+            Respond to the user in a warm, conversational tone like you're chatting with a friend.
+            Use contractions, occasionally ask questions back, and maintain a friendly, casual tone.
+            Your replies should be helpful but concise (2-4 sentences at most).
+            
+            If the question relates to the document content, base your answer on that information.
+            If the question isn't about the document, you can answer generally.
+            """
+    
+    return f"""
+            {history_context}
+            
+            User says: {prompt}
+            
+            You are a helpful, friendly AI assistant having a natural conversation.
+            Respond in a warm, conversational tone like you're chatting with a friend.
+            Use contractions, occasionally ask questions back, and maintain a friendly, casual tone.
+            Your replies should be helpful but concise (2-4 sentences at most).
+            """
+
+class ChatTurn:
+    """
+    One reply to a chat message. prepare() does the blocking lookups:
+    the user's document, retrieval, the conversation so far and the
+    answer cache. feed() splits streamed model text into sentences and
+    finish() records the exchange
+    """
+    def __init__(self, history_store, answer_cache, config, prompt, user_id=None, has_document=False):
+        self.history_store = history_store
+        self.answer_cache = answer_cache
+        self.config = config
+        self.prompt = prompt
+        self.user_id = user_id
+        self.has_document = has_document
+        self.answer = None
+        self.prompt_text = None
+        self.sentences = []
+        self._buffer = ""
+        self._cache_key = None
+        self._embedding = None
+        self._history_context = ""
+
+    def prepare(self):
+        extracted_content = ""
+        if self.user_id and self.has_document:
+            extracted_content = get_document_field(self.user_id, 'extracted_content')
+        logger.debug("Chat request with input: %r, document context: %s", self.prompt, bool(extracted_content))
+
+        document_context = build_context(
+            self.user_id, self.prompt, extracted_content, get_sentence_model(),
+            k=self.config.get('RAG_TOP_K', 4),
+            full_text_max_words=self.config.get('RAG_FULL_TEXT_MAX_WORDS', 600)
+        )
+
+        with timed('history'):
+            self._history_context = self.history_store.context(self.user_id) if self.user_id else ""
+
+        self._cache_key = document_key(extracted_content) if extracted_content else None
+        if self._cache_key and self.answer_cache.cacheable(self.prompt, self._history_context):
+            self._embedding = self.answer_cache.embed(get_sentence_model(), self.prompt)
+            self.answer = self.answer_cache.lookup(self._cache_key, self._embedding)
+
+        if self.answer is None:
+            self.prompt_text = record_prompt('chat', build_chat_prompt(self.prompt, document_context, self._history_context))
+        return self
+
+    def cached_sentences(self):
+        return [sentence.strip() for sentence in SENTENCE_END.split(self.answer) if sentence.strip()]
+
+    def feed(self, text):
+        """
+        Add streamed text and return the sentences it completed
+        """
+        parts = SENTENCE_END.split(self._buffer + text)
+        self._buffer = parts[-1]
+        sentences = [sentence.strip() for sentence in parts[:-1] if sentence.strip()]
+        self.sentences.extend(sentences)
+        return sentences
+
+    def flush(self):
+        sentence = self._buffer.strip()
+        self._buffer = ""
+        if not sentence:
+            return []
+        self.sentences.append(sentence)
+        return [sentence]
+
+    def finish(self, response_text=None):
+        """
+        Record the exchange. A freshly generated answer is also shared with
+        other users of the document when no conversation history went into it
+        """
+        if self.answer is not None:
+            self.history_store.append(self.user_id, self.prompt, self.answer)
+            return
+
+        if response_text is None:
+            response_text = " ".join(self.sentences)
+        self.history_store.append(self.user_id, self.prompt, response_text)
+        if self._embedding is not None and response_text and self.answer_cache.storable(self._history_context):
+            self.answer_cache.store(self._cache_key, self.prompt, self._embedding, response_text)
 
 def register_avatar_routes(app):
     UPLOADS_DIR = os.path.join(app.static_folder, 'uploads')
     os.makedirs(UPLOADS_DIR, exist_ok=True)
     
-    sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
+    history_store = create_history_store(app.config)
+    answer_cache = create_answer_cache(app.config)
     
-    conversation_history = {}
+    def start_turn(prompt, user_id, has_document):
+        return ChatTurn(history_store, answer_cache, app.config, prompt, user_id, has_document).prepare()
     
-    def transcribe_audio(audio_file_path):
-        recognizer = sr.Recognizer()
-        
+    def get_gemini_response(turn):
         try:
-            print(f"[DEBUG] Processing audio file: {audio_file_path}")
-            
-            audio = AudioSegment.from_file(audio_file_path)
-            
-            audio = audio.set_channels(1).set_frame_rate(16000)
-            
-            audio = audio.normalize()
+            if turn.answer is not None:
+                turn.finish()
+                return turn.answer
             
-            audio = audio.strip_silence()
-            
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_wav:
-                temp_wav_path = temp_wav.name
-                
-            audio.export(temp_wav_path, format="wav")
-            
-            with sr.AudioFile(temp_wav_path) as source:
-                recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                
-                audio_data = recognizer.record(source)
-                
-                try:
-                    text = recognizer.recognize_google(audio_data)
-                    print(f"[DEBUG] Successfully transcribed: {text}")
-                    return text
-                    
-                except sr.UnknownValueError:
-                    try:
-                        text = recognizer.recognize_sphinx(audio_data)
-                        print(f"[DEBUG] Sphinx transcription: {text}")
-                        return text
-                    except sr.UnknownValueError:
-                        return "Sorry, I couldn't understand your audio. Please try speaking more clearly."
-                    except sr.RequestError:
-                        return "Sorry, I couldn't understand your audio. Please try speaking more clearly."
-                        
-                except sr.RequestError as e:
-                    print(f"[DEBUG] Google Speech Recognition error: {e}")
-                    try:
-                        text = recognizer.recognize_sphinx(audio_data)
-                        print(f"[DEBUG] Sphinx fallback transcription: {text}")
-                        return text
-                    except:
-                        return "Sorry, there was an issue with the speech recognition service."
+            with timed('chat'):
+                response_text = get_llm_client().generate(turn.prompt_text)
             
+            turn.finish(response_text)
+            return response_text
         except Exception as e:
-            print(f"[DEBUG] Audio processing error: {str(e)}")
-            
-            try:
-                with sr.AudioFile(audio_file_path) as source:
-                    recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                    audio_data = recognizer.record(source)
-                    
-                    try:
-                        return recognizer.recognize_google(audio_data)
-                    except sr.UnknownValueError:
-                        try:
-                            return recognizer.recognize_sphinx(audio_data)
-                        except:
-                            return "Sorry, I couldn't understand your audio."
-                    except sr.RequestError:
-                        return "Sorry, there was an issue with the speech recognition service."
-                        
-            except Exception as fallback_error:
-                print(f"[DEBUG] Fallback audio processing error: {str(fallback_error)}")
-                return f"Sorry, I couldn't process your audio file. Please ensure it's a valid audio format."
+            logger.error("Error getting Gemini response: %s", e)
+            return APOLOGY
+    
+    async def stream_gemini_response(turn):
+        """
+        Yield the reply one sentence at a time as Gemini streams it, and
+        record the full exchange once the stream finishes
+        """
+        if turn.answer is not None:
+            for sentence in turn.cached_sentences():
+                yield sentence
+            await asyncio.to_thread(turn.finish)
+            return
         
+        chunks = get_llm_client().stream(turn.prompt_text)
+        try:
+            with timed('chat'):
+                async for text in chunks:
+                    for sentence in turn.feed(text):
+                        yield sentence
         finally:
-            try:
-                if 'temp_wav_path' in locals() and os.path.exists(temp_wav_path):
-                    os.unlink(temp_wav_path)
-            except:
-                pass
+            await chunks.aclose()
+        
+        for sentence in turn.flush():
+            yield sentence
+        await asyncio.to_thread(turn.finish)
     
-    def init_gemini(api_key):
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel('models/gemini-2.0-flash')
+    def transcribe_upload(audio, session_key):
+        data, content_type = audio
+        return transcribe(
+            data,
+            content_type=content_type,
+            session_key=session_key,
+            timeout=app.config.get('STT_TIMEOUT', 5)
+        )
     
-    def get_gemini_response(prompt, document_content=None, user_id=None):
+    async def chat_reply(input_type, user_input, audio, user_id, has_document, stream):
+        """
+        Transcribe a voice message, then answer as JSON or, with stream
+        set, as server-sent events one sentence at a time
+        """
         try:
-            model = init_gemini(app.config['GOOGLE_API_KEY'])
-            
-            if user_id not in conversation_history:
-                conversation_history[user_id] = []
-            
-            history_context = ""
-            if conversation_history[user_id]:
-                history_context = "Our recent conversation:\n"
-                for i, exchange in enumerate(conversation_history[user_id][-5:]):
-                    history_context += f"You: {exchange['user']}\n"
-                    history_context += f"Assistant: {exchange['assistant']}\n"
-            
-            if document_content and document_content.strip():
-                context_prompt = f"""
-                Document Content: {document_content}
-                
-                {history_context}
-                
-                User says: {prompt}
-                
-                You are a helpful, friendly AI assistant having a natural conversation. 
-                Respond to the user in a warm, conversational tone like you're chatting with a friend.
-                Use contractions, occasionally ask questions back, and maintain a friendly, casual tone.
-                Your replies should be helpful but concise (2-4 sentences at most).
-                
-                If the question relates to the document content, base your answer on that information.
-                If the question isn't about the document, you can answer generally.
-                """
-                response = model.generate_content(context_prompt)
-            else:
-                standard_prompt = f"""
-                {history_context}
-                
-                User says: {prompt}
-                
-                You are a helpful, friendly AI assistant having a natural conversation.
-                Respond in a warm, conversational tone like you're chatting with a friend.
-                Use contractions, occasionally ask questions back, and maintain a friendly, casual tone.
-                Your replies should be helpful but concise (2-4 sentences at most).
-                """
-                response = model.generate_content(standard_prompt)
+            if audio is not None:
+                try:
+                    user_input = await run_limited('stt', transcribe_upload, audio, user_id)
+                    logger.debug("Transcription result: %s", user_input)
+                    
+                except Exception as audio_error:
+                    logger.warning("Audio processing error: %s", audio_error)
+                    return jsonify({'error': f'Audio processing failed: {str(audio_error)}'}), 400
+
+            if not user_input or user_input.strip() == "":
+                return jsonify({'error': 'No valid input received'}), 400
+
+            turn = await asyncio.to_thread(start_turn, user_input, user_id, has_document)
             
-            if user_id:
-                conversation_history[user_id].append({
-                    'user': prompt,
-                    'assistant': response.text
+            if not stream:
+                return jsonify({
+                    'text': await asyncio.to_thread(get_gemini_response, turn)
                 })
-                
-                if len(conversation_history[user_id]) > 20:
-                    conversation_history[user_id] = conversation_history[user_id][-20:]
-                
-            return response.text
+
         except Exception as e:
-            print(f"Error getting Gemini response: {str(e)}")
-            return "I'm sorry, I couldn't process your request right now."
+            logger.exception("Error in avatar chat")
+            return jsonify({'error': f'Server error: {str(e)}'}), 500
+        
+        async def events():
+            if input_type == 'audio':
+                yield sse_event({'text': user_input}, event='transcript')
+            sentences = stream_gemini_response(turn)
+            try:
+                async for sentence in sentences:
+                    yield sse_event({'text': sentence})
+            except Exception as e:
+                logger.error("Error streaming Gemini response: %s", e)
+                yield sse_event({'error': APOLOGY}, event='error')
+                return
+            finally:
+                await sentences.aclose()
+            yield sse_event({}, event='done')
+        
+        return event_stream(events())
+
+    @app.route('/diagnostics/answers', methods=['GET'])
+    def answer_cache_diagnostics():
+        return jsonify(answer_cache.stats())
 
     @app.route('/avatar')
     def avatar_page():
@@ -165,86 +251,65 @@ def register_avatar_routes(app):
     
     @app.route('/avatar/context', methods=['GET'])
     def get_avatar_context():
-        if 'user_id' not in session or not session.get('has_document', False):
-            return jsonify({
+        version = None
+        if 'user_id' in session and session.get('has_document', False):
+            version = get_document_version(session['user_id'])
+        
+        etag = version or 'none'
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        if version is None:
+            response = jsonify({
                 'extracted_content': '',
-                'explanation': ''
+                'explanation': '',
+                'version': None
+            })
+        else:
+            doc_data = get_document_data(session['user_id'], ('extracted_content', 'explanation'))
+            response = jsonify({
+                'extracted_content': doc_data.get('extracted_content', ''),
+                'explanation': doc_data.get('explanation', ''),
+                'version': version
             })
         
-        doc_data = get_document_data(session['user_id'])
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    @app.route('/avatar/context/changes', methods=['GET'])
+    def watch_avatar_context():
+        since = request.args.get('since') or None
+        user_id = session.get('user_id') if session.get('has_document', False) else None
+        
+        async def changed():
+            version = await wait_for_change(user_id, since, app.config.get('CONTEXT_WATCH_TIMEOUT', 25))
+            if version == since:
+                return Response(status=204)
+            
+            return jsonify({'version': version})
         
-        return jsonify({
-            'extracted_content': doc_data.get('extracted_content', ''),
-            'explanation': doc_data.get('explanation', '')
-        })
+        return AsyncResponse(reply=changed())
     
     @app.route('/avatar/chat', methods=['POST'])
     def avatar_chat():
-        try:
-            input_type = request.form.get('type', 'text')
-            user_input = ""
-
-            if input_type == 'text':
-                user_input = request.form.get('input', '')
-            elif input_type == 'audio':
-                if 'audio' not in request.files:
-                    return jsonify({'error': 'No audio file provided'}), 400
-
-                audio_file = request.files['audio']
-                
-                temp_audio_path = None
-                try:
-                    file_extension = '.wav'  
-                    if audio_file.content_type:
-                        if 'mp3' in audio_file.content_type:
-                            file_extension = '.mp3'
-                        elif 'mp4' in audio_file.content_type:
-                            file_extension = '.mp4'
-                        elif 'webm' in audio_file.content_type:
-                            file_extension = '.webm'
-                        elif 'ogg' in audio_file.content_type:
-                            file_extension = '.ogg'
-                    
-                    with tempfile.NamedTemporaryFile(suffix=file_extension, delete=False) as temp_audio:
-                        audio_file.save(temp_audio.name)
-                        temp_audio_path = temp_audio.name
-                    
-                    print(f"[DEBUG] Saved audio file to: {temp_audio_path}")
-                    print(f"[DEBUG] Audio file size: {os.path.getsize(temp_audio_path)} bytes")
-                    
-                    user_input = transcribe_audio(temp_audio_path)
-                    print(f"[DEBUG] Transcription result: {user_input}")
-                    
-                except Exception as audio_error:
-                    print(f"[DEBUG] Audio processing error: {str(audio_error)}")
-                    return jsonify({'error': f'Audio processing failed: {str(audio_error)}'}), 400
-                    
-                finally:
-                    if temp_audio_path and os.path.exists(temp_audio_path):
-                        try:
-                            os.unlink(temp_audio_path)
-                        except:
-                            pass
+        request.max_content_length = app.config.get('CHAT_MAX_BYTES', 10 * 1024 * 1024)
+        input_type = request.form.get('type', 'text')
+        user_input = ""
+        audio = None
 
-            if not user_input or user_input.strip() == "":
-                return jsonify({'error': 'No valid input received'}), 400
-
-            extracted_content = ""
-            if 'user_id' in session and session.get('has_document', False):
-                doc_data = get_document_data(session['user_id'])
-                extracted_content = doc_data.get('extracted_content', '')
-            
-            print(f"Chat request with input: '{user_input}'")
-            print(f"Using document context? {'Yes' if extracted_content else 'No'}")
-            
-            user_id = session.get('user_id')
-            
-            response_text = get_gemini_response(user_input, extracted_content, user_id)
+        if input_type == 'text':
+            user_input = request.form.get('input', '')
+        elif input_type == 'audio':
+            if 'audio' not in request.files:
+                return jsonify({'error': 'No audio file provided'}), 400
+            audio_file = request.files['audio']
+            audio = (audio_file.read(), audio_file.content_type)
 
-            return jsonify({
-                'text': response_text
-            })
-
-        except Exception as e:
-            print(f"Error in avatar chat: {str(e)}")
-            return jsonify({'error': f'Server error: {str(e)}'}), 500
+        return AsyncResponse(reply=chat_reply(
+            input_type, user_input, audio,
+            session.get('user_id'), session.get('has_document', False),
+            stream=request.form.get('stream') == '1'
+        ))
@@ -0,0 +1,159 @@
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import backend_wait_seconds
+
+logger = logging.getLogger(__name__)
+
+# Backends capped here, with the config key giving their slot count.
+# Gemini, TTS and embeddings bound themselves (llm_client, tts_utils and
+# the embedder's batch workers)
+LIMIT_SETTINGS = {'stt': 'STT_MAX_CONCURRENCY'}
+
+_limits = {}
+_executors = {}
+# Backends whose slot the current call already holds (see run_limited)
+_held = contextvars.ContextVar('held_backend_slots', default=frozenset())
+
+class Slots:
+    """
+    Counting semaphore shared by threads and asyncio tasks, handing slots
+    over in arrival order
+    """
+    def __init__(self, size):
+        self._free = size
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def acquire(self):
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        waiter.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            if not queued and waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+
+        loop, future = waiter
+        try:
+            loop.call_soon_threadsafe(self._hand_over, future)
+        except RuntimeError:
+            self.release()
+
+    def _hand_over(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+def configure_limits(config):
+    """
+    Cap how many calls may be in flight at once for each backend in
+    LIMIT_SETTINGS. Requests beyond the cap wait their turn instead of
+    piling onto a slow service
+    """
+    for name, key in LIMIT_SETTINGS.items():
+        size = config.get(key, 0)
+        _limits[name] = Slots(size) if size > 0 else None
+        if size > 0 and name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=name)
+        logger.debug("Backend %s concurrency limit: %s", name, size or 'none')
+
+@contextmanager
+def limited(name):
+    """
+    Hold one of the backend's slots for the enclosed call, recording how
+    long it took to get one
+    """
+    slots = _limits.get(name)
+    if slots is None or name in _held.get():
+        yield
+        return
+
+    started = time.perf_counter()
+    slots.acquire()
+    backend_wait_seconds.observe(name, time.perf_counter() - started)
+    try:
+        yield
+    finally:
+        slots.release()
+
+async def run_limited(name, function, *args):
+    """
+    Make a blocking backend call from async code, on the backend's own
+    pool once a slot is free. A call already running keeps its slot
+    until it returns, even if the caller is cancelled
+    """
+    slots = _limits.get(name)
+    if slots is None:
+        return await asyncio.to_thread(function, *args)
+
+    started = time.perf_counter()
+    await slots.acquire_async()
+    backend_wait_seconds.observe(name, time.perf_counter() - started)
+
+    def call():
+        try:
+            return function(*args)
+        finally:
+            slots.release()
+
+    token = _held.set(_held.get() | {name})
+    try:
+        context = contextvars.copy_context()
+    finally:
+        _held.reset(token)
+
+    future = _executors[name].submit(context.run, call)
+    return await asyncio.shield(asyncio.wrap_future(future))
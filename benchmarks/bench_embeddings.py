@@ -0,0 +1,201 @@
+"""
+CPU embedding backend benchmark.
+
+Each backend (torch, onnx, int8) is loaded in a fresh interpreter so
+memory is measured in isolation. For each one it reports load time, peak
+RSS, single-query latency, bulk throughput, the throughput of many
+concurrent single-query callers with and without the micro-batching
+Embedder, cached-query latency, and how closely its vectors agree with
+the torch backend. Backends whose dependencies are missing are skipped;
+"hashing" is a dependency-free stand-in that exercises the cache and
+batcher.
+
+    python benchmarks/bench_embeddings.py --backends torch,onnx,int8 --threads 32
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import make_text
+
+def sentences(count, seed=0):
+    """
+    Distinct sentence-length strings built from the benchmark vocabulary
+    """
+    texts = []
+    while len(texts) < count:
+        words = make_text(seed).split()
+        texts.extend(" ".join(words[i:i + 15]) for i in range(0, len(words) - 15, 15))
+        seed += 1
+    return texts[:count]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def load(backend, onnx_file):
+    if backend == 'hashing':
+        from bench_endpoints import HashingSentenceModel
+        return HashingSentenceModel()
+
+    from model_registry import SENTENCE_MODEL_NAME
+    from embedding_utils import load_sentence_model
+    return load_sentence_model(SENTENCE_MODEL_NAME, backend, onnx_file)
+
+def concurrent_run(encode, texts, threads):
+    """
+    Encode texts one per call from a pool of threads; returns
+    (throughput, per-call latencies)
+    """
+    latencies = []
+    lock = threading.Lock()
+    position = iter(range(len(texts)))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(position, None)
+            if index is None:
+                return
+            started = time.perf_counter()
+            encode([texts[index]])
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return len(texts) / (time.perf_counter() - started), latencies
+
+def probe(args):
+    from embedding_utils import Embedder
+
+    started = time.perf_counter()
+    model = load(args.probe, args.onnx_file)
+    load_seconds = time.perf_counter() - started
+
+    encode = lambda texts, **kwargs: model.encode(texts, normalize_embeddings=True, **kwargs)
+    encode(sentences(8, seed=999))
+
+    queries = sentences(args.queries, seed=1)
+    single = []
+    for text in queries:
+        started = time.perf_counter()
+        encode([text])
+        single.append(time.perf_counter() - started)
+
+    bulk = sentences(args.bulk, seed=2)
+    started = time.perf_counter()
+    encode(bulk, batch_size=32)
+    bulk_rate = len(bulk) / (time.perf_counter() - started)
+
+    concurrent = sentences(args.queries * 4, seed=3)
+    direct_rate, direct_latencies = concurrent_run(encode, concurrent, args.threads)
+
+    embedder = Embedder(model, backend=args.probe, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+    batched = sentences(args.queries * 4, seed=4)
+    batched_rate, batched_latencies = concurrent_run(embedder.encode, batched, args.threads)
+
+    cached = []
+    for text in batched[:args.queries]:
+        started = time.perf_counter()
+        embedder.encode([text])
+        cached.append(time.perf_counter() - started)
+
+    np.save(args.vectors, np.asarray(encode(queries), dtype=np.float32))
+
+    return {
+        'backend': args.probe,
+        'load_seconds': load_seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'single_p50_ms': statistics.median(single) * 1000,
+        'single_p95_ms': percentile(single, 0.95) * 1000,
+        'bulk_texts_per_s': bulk_rate,
+        'concurrent_texts_per_s': direct_rate,
+        'concurrent_p95_ms': percentile(direct_latencies, 0.95) * 1000,
+        'batched_texts_per_s': batched_rate,
+        'batched_p95_ms': percentile(batched_latencies, 0.95) * 1000,
+        'cached_p50_ms': statistics.median(cached) * 1000
+    }
+
+def run_backend(backend, args, scratch):
+    vectors = os.path.join(scratch, f"{backend}.npy")
+    command = [
+        sys.executable, os.path.abspath(__file__), '--probe', backend, '--vectors', vectors,
+        '--queries', str(args.queries), '--bulk', str(args.bulk), '--threads', str(args.threads),
+        '--max-batch', str(args.max_batch), '--max-wait-ms', str(args.max_wait_ms)
+    ]
+    if args.onnx_file:
+        command += ['--onnx-file', args.onnx_file]
+
+    process = subprocess.run(command, capture_output=True, text=True, cwd=scratch)
+    if process.returncode != 0:
+        reason = (process.stderr.strip().splitlines() or ['failed'])[-1]
+        print(f"{backend:<8} skipped: {reason}")
+        return None, None
+    return json.loads(process.stdout.strip().splitlines()[-1]), np.load(vectors)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default='torch,onnx,int8', help='comma-separated: torch, onnx, int8, hashing')
+    parser.add_argument('--queries', type=int, default=200, help='single-query calls per measurement')
+    parser.add_argument('--bulk', type=int, default=2000, help='texts in the bulk throughput run')
+    parser.add_argument('--threads', type=int, default=32, help='concurrent callers')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2)
+    parser.add_argument('--onnx-file', default='', help='ONNX export for the onnx backend, e.g. onnx/model_quint8_avx2.onnx')
+    parser.add_argument('--probe', help=argparse.SUPPRESS)
+    parser.add_argument('--vectors', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(args)))
+        return
+
+    results = {}
+    vectors = {}
+    with tempfile.TemporaryDirectory(prefix='bench-embed-') as scratch:
+        for backend in [name.strip() for name in args.backends.split(',') if name.strip()]:
+            result, backend_vectors = run_backend(backend, args, scratch)
+            if result is not None:
+                results[backend] = result
+                vectors[backend] = backend_vectors
+
+    if not results:
+        sys.exit(1)
+
+    reference = vectors.get('torch')
+    print(
+        f"\n{'backend':<8} {'load s':>7} {'RSS MB':>7} {'1q p50':>8} {'1q p95':>8} {'bulk/s':>8} "
+        f"{'conc/s':>8} {'conc p95':>9} {'batch/s':>8} {'batch p95':>9} {'cached':>8} {'cos/torch':>9}"
+    )
+    for backend, r in results.items():
+        agreement = '-'
+        if reference is not None and vectors[backend].shape == reference.shape:
+            agreement = f"{float(np.mean(np.sum(vectors[backend] * reference, axis=1))):.4f}"
+        print(
+            f"{backend:<8} {r['load_seconds']:>7.2f} {r['peak_rss_mb']:>7.0f} "
+            f"{r['single_p50_ms']:>6.2f}ms {r['single_p95_ms']:>6.2f}ms {r['bulk_texts_per_s']:>8.0f} "
+            f"{r['concurrent_texts_per_s']:>8.0f} {r['concurrent_p95_ms']:>7.1f}ms "
+            f"{r['batched_texts_per_s']:>8.0f} {r['batched_p95_ms']:>7.1f}ms "
+            f"{r['cached_p50_ms']:>6.3f}ms {agreement:>9}"
+        )
+
+if __name__ == '__main__':
+    main()
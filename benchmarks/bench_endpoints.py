@@ -0,0 +1,408 @@
+"""
+End-to-end latency and load benchmark for the Flask app.
+
+Runs the real app in-process behind the ASGI front under uvicorn (or,
+with --server wsgi, the Flask app behind a threaded WSGI server), with
+the Gemini, speech recognition and TTS backends replaced by local stubs,
+and drives /upload, /generate_quiz, /avatar/chat and /talk with a
+synthetic corpus. --tabs keeps that many avatar tabs long-polling
+/avatar/context/changes throughout, to show open tabs do not use up the
+server. The app runs in a scratch directory so uploads, audio and
+session data never touch the checkout. Results are written to
+benchmarks/results/ and compared with the previous run to flag
+regressions.
+
+    python benchmarks/bench_endpoints.py --requests 50 --concurrency 8
+    python benchmarks/bench_endpoints.py --tabs 1000 --llm-latency 0.5
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import hashlib
+import argparse
+import importlib.util
+import queue
+import resource
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from http.cookiejar import CookieJar
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import corpus
+
+STUB_ENV = {
+    'LLM_BACKEND': 'stub',
+    'TTS_BACKEND': 'stub',
+    'STT_BACKENDS': 'stub',
+}
+
+class HashingSentenceModel:
+    """
+    Cheap stand-in for the sentence-transformers model: hashed bag of words
+    """
+    dimensions = 384
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimensions] += 1
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+def use_stub_embeddings(requested):
+    if requested:
+        return True
+    if importlib.util.find_spec('sentence_transformers') is not None:
+        return False
+    print("sentence-transformers is not installed, using hashed embeddings")
+    return True
+
+class Client:
+    """
+    Minimal HTTP client with its own cookie jar, i.e. one browser session
+    """
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def request(self, method, path, body=None, headers=None):
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers or {})
+        with self.opener.open(req, timeout=300) as response:
+            return response.status, response.read()
+
+    def post_json(self, path, payload):
+        return self.request('POST', path, json.dumps(payload).encode(), {'Content-Type': 'application/json'})
+
+    def post_multipart(self, path, fields, files):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in fields.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            )
+        for name, (filename, content, content_type) in files.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b'\r\n'
+            )
+        parts.append(f'--{boundary}--\r\n'.encode())
+        return self.request(
+            'POST', path, b''.join(parts),
+            {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+        )
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(name, latencies, errors, wall_seconds):
+    return {
+        'endpoint': name,
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+        'throughput_rps': round(len(latencies) / wall_seconds, 2) if wall_seconds else None
+    }
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+def run_load(name, scenario, clients, total, concurrency):
+    """
+    Run scenario(client, i) total times, each client (one session) used by
+    one request at a time so uploads do not cancel each other
+    """
+    pool = queue.Queue()
+    for client in clients:
+        pool.put(client)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def task(i):
+        client = pool.get()
+        started = time.perf_counter()
+        try:
+            scenario(client, i)
+        except Exception as e:
+            print(f"[{name}] request {i} failed: {e}")
+            with lock:
+                errors[0] += 1
+            return
+        finally:
+            pool.put(client)
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(task, range(total)))
+    wall = time.perf_counter() - started
+
+    result = summarize(name, latencies, errors[0], wall)
+    print(
+        f"{name:<16} n={result['requests']:<4} err={result['errors']:<3} "
+        f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms "
+        f"rps={result['throughput_rps']}"
+    )
+    return result
+
+def build_scenarios(workdir, doc_types):
+    audio_path = os.path.join(workdir, 'question.wav')
+    corpus.make_wav(audio_path)
+    with open(audio_path, 'rb') as f:
+        audio_bytes = f.read()
+
+    def upload(client, i):
+        doc_type = doc_types[i % len(doc_types)]
+        path = os.path.join(workdir, f'doc-{i}.{doc_type}')
+        corpus.MAKERS[doc_type](path, seed=f'{uuid.uuid4().hex}-{i}')
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        status, body = client.post_multipart(
+            '/upload', {}, {'file': (os.path.basename(path), content, 'application/octet-stream')}
+        )
+        job = json.loads(body)
+        while True:
+            status, body = client.request('GET', f"/jobs/{job['job_id']}")
+            state = json.loads(body)
+            if state['status'] == 'completed':
+                return
+            if state['status'] in ('failed', 'cancelled'):
+                raise RuntimeError(state.get('error') or state['status'])
+            time.sleep(0.05)
+
+    def generate_quiz(client, i):
+        client.post_json('/generate_quiz', {
+            'extracted_text': corpus.make_text(f'quiz-{i}', 400),
+            'difficulty': 'mixed',
+            'taxonomy': 'mixed',
+            'format': 'mixed'
+        })
+
+    def chat_text(client, i):
+        client.post_multipart('/avatar/chat', {'type': 'text', 'input': f'Can you explain point {i} again?'}, {})
+
+    def chat_stream(client, i):
+        status, body = client.post_multipart(
+            '/avatar/chat', {'type': 'text', 'input': f'What does part {i} mean?', 'stream': '1'}, {}
+        )
+        if b'event: done' not in body:
+            raise RuntimeError("stream ended without a done event")
+
+    def quiz_stream(client, i):
+        status, body = client.post_json('/generate_quiz', {
+            'extracted_text': corpus.make_text(f'quiz-{i}', 400),
+            'stream': True
+        })
+        if b'event: done' not in body and b'event: error' not in body:
+            raise RuntimeError("stream ended without a done event")
+
+    def chat_audio(client, i):
+        client.post_multipart(
+            '/avatar/chat', {'type': 'audio'}, {'audio': ('question.wav', audio_bytes, 'audio/wav')}
+        )
+
+    def talk(client, i):
+        client.post_json('/talk', {'text': corpus.make_text(f'talk-{i % 5}', 60)})
+
+    return [
+        ('/upload', upload),
+        ('/generate_quiz', generate_quiz),
+        ('/generate_quiz:stream', quiz_stream),
+        ('/avatar/chat', chat_text),
+        ('/avatar/chat:stream', chat_stream),
+        ('/avatar/chat:audio', chat_audio),
+        ('/talk', talk),
+    ]
+
+class OpenTabs:
+    """
+    count avatar tabs, each its own session, long-polling for document
+    changes until stopped
+    """
+    def __init__(self, base_url, count):
+        self.stop = threading.Event()
+        self.polls = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self.poll, args=(Client(base_url),), daemon=True)
+            for _ in range(count)
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def poll(self, client):
+        while not self.stop.is_set():
+            try:
+                client.request('GET', '/avatar/context/changes')
+                outcome = 'polls'
+            except Exception:
+                outcome = 'errors'
+                time.sleep(1)
+            with self.lock:
+                setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def close(self):
+        self.stop.set()
+        return {'tabs': len(self.threads), 'polls': self.polls, 'errors': self.errors}
+
+def start_server(app, server):
+    """
+    Serve app on a free local port in a background thread; returns
+    (base_url, shutdown)
+    """
+    if server == 'wsgi':
+        from werkzeug.serving import make_server
+        wsgi_server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=wsgi_server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{wsgi_server.server_port}', wsgi_server.shutdown
+
+    import uvicorn
+    from asgi_app import AsyncFront
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    asgi_server = uvicorn.Server(uvicorn.Config(
+        AsyncFront(app, threads=int(os.getenv('WEB_THREADS', 64))),
+        log_level='warning', backlog=4096, timeout_keep_alive=30
+    ))
+    threading.Thread(target=asgi_server.run, kwargs={'sockets': [sock]}, daemon=True).start()
+    while not asgi_server.started:
+        time.sleep(0.05)
+
+    def shutdown():
+        asgi_server.should_exit = True
+    return f'http://127.0.0.1:{sock.getsockname()[1]}', shutdown
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+def latest_result(exclude=None):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    names = sorted(name for name in os.listdir(RESULTS_DIR) if name.endswith('.json'))
+    names = [name for name in names if os.path.join(RESULTS_DIR, name) != exclude]
+    return os.path.join(RESULTS_DIR, names[-1]) if names else None
+
+def compare(current, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {row['endpoint']: row for row in baseline['endpoints']}
+
+    regressions = []
+    print(f"\nCompared with {os.path.basename(baseline_path)} (commit {baseline.get('commit')}):")
+    for row in current['endpoints']:
+        old = previous.get(row['endpoint'])
+        if not old or not old.get('p95_ms') or not row.get('p95_ms'):
+            continue
+        change = (row['p95_ms'] - old['p95_ms']) / old['p95_ms']
+        flag = 'REGRESSION' if change > tolerance else ''
+        print(f"  {row['endpoint']:<18} p95 {old['p95_ms']} -> {row['p95_ms']} ms ({change:+.0%}) {flag}")
+        if flag:
+            regressions.append(row['endpoint'])
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=40, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--types', default='pdf,docx,pptx', help='document types to upload')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='simulated LLM latency in seconds')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='p95 increase that counts as a regression')
+    parser.add_argument('--stub-embeddings', action='store_true', help='use hashed embeddings instead of the real model')
+    parser.add_argument('--server', choices=('asgi', 'wsgi'), default='asgi')
+    parser.add_argument('--tabs', type=int, default=0, help='avatar tabs long-polling for changes during the run')
+    parser.add_argument('--compare', help='result file to compare against (default: latest)')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    os.environ.update(STUB_ENV)
+    os.environ['LLM_STUB_LATENCY'] = str(args.llm_latency)
+    scratch = tempfile.mkdtemp(prefix='bench-app-')
+    os.chdir(scratch)
+
+    startup = time.perf_counter()
+    import upload_app
+    app = upload_app.create_app()
+    startup = time.perf_counter() - startup
+
+    stub_embeddings = use_stub_embeddings(args.stub_embeddings)
+    if stub_embeddings:
+        import model_registry
+        model_registry._loaders['sentence'] = HashingSentenceModel
+
+    base_url, shutdown = start_server(app, args.server)
+
+    tabs = OpenTabs(base_url, args.tabs)
+    tabs.start()
+
+    clients = [Client(base_url) for _ in range(args.concurrency)]
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, scenario in build_scenarios(workdir, args.types.split(',')):
+            rows.append(run_load(name, scenario, clients, args.requests, args.concurrency))
+
+    tabs = tabs.close()
+    if tabs['tabs']:
+        print(f"{tabs['tabs']} open tabs: {tabs['polls']} long-polls answered, {tabs['errors']} failed")
+    shutdown()
+    os.chdir(ROOT)
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    result = {
+        'commit': current_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'requests_per_endpoint': args.requests,
+        'concurrency': args.concurrency,
+        'llm_latency': args.llm_latency,
+        'server': args.server,
+        'open_tabs': tabs,
+        'stub_embeddings': stub_embeddings,
+        'import_seconds': round(startup, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'endpoints': rows
+    }
+    print(f"\nimport {result['import_seconds']}s, peak RSS {result['peak_rss_mb']} MB")
+
+    path = None
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{result['commit']}.json")
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved {os.path.relpath(path, ROOT)}")
+
+    baseline = args.compare or latest_result(exclude=path)
+    if baseline and compare(result, baseline, args.tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Cold-start benchmark for the app factory.
+
+Each run starts a fresh interpreter and measures how long it takes to
+import upload_app, build the app with create_app(), and answer the first
+/healthz request, plus peak RSS and which heavy libraries were imported
+along the way. With --warm it also times how long /readyz takes to turn
+ready once MODEL_WARMUP loads the models. Medians are written to
+benchmarks/results/startup/ (or --output) and compared with the previous
+run to flag regressions, as bench_endpoints.py does.
+
+    python benchmarks/bench_startup.py --runs 5 --warm
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results', 'startup')
+
+HEAVY_MODULES = (
+    'docx', 'pptx', 'pytesseract', 'pdf2image', 'pdfplumber', 'PIL.Image',
+    'speech_recognition', 'pydub', 'gtts', 'google.generativeai',
+    'sentence_transformers', 'transformers', 'torch'
+)
+
+PROBE = r"""
+import sys, time, json, resource
+sys.path.insert(0, sys.argv[1])
+warm = sys.argv[2] == '1'
+
+started = time.perf_counter()
+import upload_app
+imported = time.perf_counter()
+app = upload_app.create_app()
+created = time.perf_counter()
+client = app.test_client()
+assert client.get('/healthz').status_code == 200
+served = time.perf_counter()
+heavy = sorted(name for name in json.loads(sys.argv[3]) if name in sys.modules)
+
+ready = None
+if warm:
+    while client.get('/readyz').status_code != 200:
+        if time.perf_counter() - served > 600:
+            break
+        time.sleep(0.05)
+    else:
+        ready = time.perf_counter() - started
+
+print(json.dumps({
+    'import_seconds': imported - started,
+    'create_app_seconds': created - imported,
+    'first_request_seconds': served - started,
+    'ready_seconds': ready,
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'heavy_modules': heavy
+}))
+"""
+
+def run_once(warm, env):
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as scratch:
+        output = subprocess.check_output(
+            [sys.executable, '-c', PROBE, ROOT, '1' if warm else '0', json.dumps(HEAVY_MODULES)],
+            cwd=scratch, env=env, text=True
+        )
+    return json.loads(output.strip().splitlines()[-1])
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+def latest_result(exclude=None):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    names = sorted(name for name in os.listdir(RESULTS_DIR) if name.endswith('.json'))
+    names = [name for name in names if os.path.join(RESULTS_DIR, name) != exclude]
+    return os.path.join(RESULTS_DIR, names[-1]) if names else None
+
+def compare(current, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    print(f"\nCompared with {os.path.basename(baseline_path)} (commit {baseline.get('commit')}):")
+    for key, value in current['medians'].items():
+        old = baseline.get('medians', {}).get(key)
+        if not old or not value:
+            continue
+        change = (value - old) / old
+        flag = 'REGRESSION' if change > tolerance else ''
+        print(f"  {key:<22} median {old:.3f} -> {value:.3f} ({change:+.0%}) {flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warm', action='store_true', help='also time model warm-up until /readyz is ready')
+    parser.add_argument('--llm-backend', default='stub', help='LLM_BACKEND for the probe (gemini needs GOOGLE_API_KEY)')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='median increase that counts as a regression')
+    parser.add_argument('--output', help='result file to write (default: benchmarks/results/startup/<time>-<commit>.json)')
+    parser.add_argument('--compare', help='result file to compare against (default: latest)')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        'LLM_BACKEND': args.llm_backend,
+        'MODEL_WARMUP': '1' if args.warm else '0',
+        'LOG_LEVEL': 'WARNING'
+    })
+
+    runs = [run_once(args.warm, env) for _ in range(args.runs)]
+
+    medians = {}
+    for key in ('import_seconds', 'create_app_seconds', 'first_request_seconds', 'ready_seconds', 'peak_rss_mb'):
+        values = [run[key] for run in runs if run[key] is not None]
+        if values:
+            medians[key] = round(statistics.median(values), 3)
+            print(f"{key:<22} median {statistics.median(values):.3f}  min {min(values):.3f}  max {max(values):.3f}")
+    print(f"heavy modules loaded before first request: {', '.join(runs[-1]['heavy_modules']) or 'none'}")
+
+    result = {
+        'commit': current_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': args.runs,
+        'warm': args.warm,
+        'llm_backend': args.llm_backend,
+        'medians': medians,
+        'heavy_modules': runs[-1]['heavy_modules']
+    }
+
+    path = None
+    if not args.no_save:
+        path = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{result['commit']}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved {os.path.relpath(path, ROOT)}")
+
+    baseline = args.compare or latest_result(exclude=os.path.abspath(path) if path else None)
+    if baseline and compare(result, baseline, args.tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import io
+import math
+import wave
+import random
+import struct
+
+VOCABULARY = (
+    "cell membrane protein energy enzyme molecule nucleus genome evolution "
+    "photosynthesis respiration ecosystem population mutation inheritance "
+    "force velocity momentum gravity friction circuit voltage current "
+    "algorithm variable function recursion memory network database "
+    "economy market supply demand inflation policy history culture"
+).split()
+
+def make_text(seed, words=300):
+    """
+    Deterministic pseudo-lecture text of roughly the given length
+    """
+    rng = random.Random(seed)
+    sentences = []
+    count = 0
+    while count < words:
+        length = rng.randint(8, 18)
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        count += length
+    return " ".join(sentences)
+
+def make_docx(path, seed, paragraphs=20):
+    import docx
+    document = docx.Document()
+    document.add_heading(f"Lecture {seed}", 0)
+    for i in range(paragraphs):
+        document.add_paragraph(make_text(f"{seed}-{i}", 80))
+    document.save(path)
+
+def make_pptx(path, seed, slides=15):
+    import pptx
+    presentation = pptx.Presentation()
+    layout = presentation.slide_layouts[1]
+    for i in range(slides):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {i + 1}"
+        slide.placeholders[1].text = make_text(f"{seed}-{i}", 50)
+    presentation.save(path)
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(path, seed, pages=5):
+    """
+    Write a minimal PDF with a real text layer, one block of text per page
+    """
+    objects = []
+    page_ids = []
+    font_id = 3
+    for i in range(pages):
+        words = make_text(f"{seed}-{i}", 120).split()
+        lines = [" ".join(words[j:j + 12]) for j in range(0, len(words), 12)]
+        stream = "BT /F1 11 Tf 50 780 Td 14 TL " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        content_id = 4 + i * 2
+        page_id = content_id + 1
+        objects.append((content_id, f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"))
+        objects.append((page_id, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content_id} 0 R /Resources << /Font << /F1 {font_id} 0 R >> >> >>"))
+        page_ids.append(page_id)
+
+    objects.append((1, "<< /Type /Catalog /Pages 2 0 R >>"))
+    objects.append((2, f"<< /Type /Pages /Kids [{' '.join(f'{p} 0 R' for p in page_ids)}] /Count {pages} >>"))
+    objects.append((font_id, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"))
+    objects.sort()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for number, body in objects:
+        offsets[number] = out.tell()
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+
+    xref = out.tell()
+    count = len(objects) + 1
+    out.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode())
+    for number in range(1, count):
+        out.write(f"{offsets[number]:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+    with open(path, "wb") as f:
+        f.write(out.getvalue())
+
+def make_wav(path, seconds=3, rate=16000):
+    """
+    A spoken-length tone with a short silent lead-in, as 16-bit mono WAV
+    """
+    frames = bytearray()
+    for i in range(int(seconds * rate)):
+        sample = 0 if i < rate // 4 else int(6000 * math.sin(2 * math.pi * 220 * i / rate))
+        frames += struct.pack("<h", sample)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(frames))
+
+MAKERS = {
+    "pdf": make_pdf,
+    "docx": make_docx,
+    "pptx": make_pptx,
+}
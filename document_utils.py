@@ -1,36 +1,206 @@
 import os
-import pickle
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
 
 SESSION_DIR = 'session_data'
 os.makedirs(SESSION_DIR, exist_ok=True)
 
+DB_PATH = os.path.join(SESSION_DIR, 'documents.db')
+FIELDS = ('extracted_content', 'explanation', 'quiz')
+CACHE_SIZE = 256
+
+_local = threading.local()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_waiters = set()
+_waiters_lock = threading.Lock()
+
+def _conn():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                user_id TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                extracted_content TEXT NOT NULL DEFAULT '',
+                explanation TEXT NOT NULL DEFAULT '',
+                quiz TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+def _invalidate(user_id):
+    with _cache_lock:
+        _cache.pop(user_id, None)
+
+def _notify_change():
+    with _waiters_lock:
+        waiters = list(_waiters)
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass
+
+def document_key(text):
+    """
+    Content hash of a document's text, shared by every user who uploads it
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def document_version(data):
+    """
+    Content hash identifying one revision of a user's document
+    """
+    digest = hashlib.sha256()
+    for field in FIELDS:
+        digest.update(str(data.get(field, '')).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
 def store_document_data(user_id, data):
     """
-    Store document data to file system instead of session
+    Store document data in the document database and drop the cached copy
+    """
+    version = document_version(data)
+    conn = _conn()
+    with conn:
+        conn.execute(
+            """INSERT OR REPLACE INTO documents
+               (user_id, version, updated_at, extracted_content, explanation, quiz)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (user_id, version, time.time()) + tuple(str(data.get(field, '')) for field in FIELDS)
+        )
+    _invalidate(user_id)
+    _notify_change()
+
+    return version
+
+def get_document_version(user_id):
+    """
+    Current document version for a user, or None if there is no document
+    """
+    row = _conn().execute(
+        "SELECT version FROM documents WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+async def wait_for_change(user_id, since, timeout, poll_interval=1.0):
+    """
+    Wait until the user's document version differs from since, or the
+    timeout passes. Writes in this process wake waiters immediately; the
+    periodic check picks up writes from other workers.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    waiter = (loop, asyncio.Event())
+    with _waiters_lock:
+        _waiters.add(waiter)
+    try:
+        while True:
+            waiter[1].clear()
+            version = await asyncio.to_thread(get_document_version, user_id) if user_id else None
+            if version != since:
+                return version
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return since
+
+            try:
+                await asyncio.wait_for(waiter[1].wait(), min(poll_interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        with _waiters_lock:
+            _waiters.discard(waiter)
+
+def get_document_data(user_id, fields=FIELDS):
     """
-    filename = os.path.join(SESSION_DIR, f"doc_{user_id}.pkl")
-    
-    with open(filename, 'wb') as f:
-        pickle.dump(data, f)
-    
-    return filename
+    Retrieve document fields, loading only the columns not already cached
+    """
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown document fields: {', '.join(sorted(unknown))}")
+
+    version = get_document_version(user_id)
+    if version is None:
+        _invalidate(user_id)
+        return {field: '' for field in fields}
 
-def get_document_data(user_id):
+    with _cache_lock:
+        cached = _cache.get(user_id)
+        if cached is None or cached['version'] != version:
+            cached = {'version': version, 'fields': {}}
+            _cache[user_id] = cached
+        _cache.move_to_end(user_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+        missing = [field for field in fields if field not in cached['fields']]
+
+    if missing:
+        row = _conn().execute(
+            f"SELECT version, {', '.join(missing)} FROM documents WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        if row is None:
+            _invalidate(user_id)
+            return {field: '' for field in fields}
+        if row[0] == version:
+            with _cache_lock:
+                cached['fields'].update(zip(missing, row[1:]))
+        else:
+            return get_document_data(user_id, fields)
+
+    return {field: cached['fields'].get(field, '') for field in fields}
+
+def get_document_field(user_id, field):
     """
-    Retrieve document data from file system
+    Retrieve a single document field, e.g. just the explanation
     """
-    filename = os.path.join(SESSION_DIR, f"doc_{user_id}.pkl")
-    
-    if not os.path.exists(filename):
-        return {"extracted_content": "", "explanation": ""}
-    
-    with open(filename, 'rb') as f:
-        return pickle.load(f)
+    return get_document_data(user_id, (field,))[field]
 
 def clear_document_data(user_id):
     """
-    Remove document data file if it exists
+    Remove the user's document if it exists
+    """
+    conn = _conn()
+    with conn:
+        conn.execute("DELETE FROM documents WHERE user_id = ?", (user_id,))
+    _invalidate(user_id)
+    _notify_change()
+
+def collect_garbage(max_age):
+    """
+    Delete documents and per-user files not updated for max_age seconds,
+    along with legacy pickle files, which are never loaded
     """
-    filename = os.path.join(SESSION_DIR, f"doc_{user_id}.pkl")
-    if os.path.exists(filename):
-        os.remove(filename)
+    cutoff = time.time() - max_age
+    conn = _conn()
+    with conn:
+        stale = [row[0] for row in conn.execute(
+            "SELECT user_id FROM documents WHERE updated_at < ?", (cutoff,)
+        )]
+        conn.execute("DELETE FROM documents WHERE updated_at < ?", (cutoff,))
+    for user_id in stale:
+        _invalidate(user_id)
+
+    for name in os.listdir(SESSION_DIR):
+        path = os.path.join(SESSION_DIR, name)
+        legacy = name.startswith('doc_') and name.endswith('.pkl')
+        stale_index = name.startswith('index_') and name.endswith('.npz') and os.path.getmtime(path) < cutoff
+        if legacy or stale_index:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    return len(stale)
@@ -0,0 +1,154 @@
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import backend_wait_seconds, embed_batch_size, embedding_cache_events
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'onnx', 'int8')
+
+def load_sentence_model(name, backend='torch', onnx_file=None):
+    """
+    Load a sentence-transformers model for CPU inference: full-precision
+    PyTorch, ONNX Runtime (optionally a specific export such as
+    onnx/model_quint8_avx2.onnx), or PyTorch with its Linear layers
+    dynamically quantized to int8
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == 'torch':
+        return SentenceTransformer(name, device='cpu')
+    elif backend == 'onnx':
+        model_kwargs = {'file_name': onnx_file} if onnx_file else None
+        return SentenceTransformer(name, device='cpu', backend='onnx', model_kwargs=model_kwargs)
+    elif backend == 'int8':
+        import torch
+        model = SentenceTransformer(name, device='cpu')
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+class _MicroBatcher:
+    """
+    Feeds the model from a queue, merging the texts of requests that
+    arrive within max_wait seconds of each other (up to max_batch) into
+    one encode call
+    """
+    def __init__(self, model, max_batch=64, max_wait=0.002, workers=1):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        for number in range(max(1, workers)):
+            threading.Thread(target=self._run, name=f'embed-{number}', daemon=True).start()
+
+    def submit(self, texts):
+        future = Future()
+        self._queue.put((texts, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for _, _, queued in batch:
+                backend_wait_seconds.observe('embed', started - queued)
+
+            texts = [text for request_texts, _, _ in batch for text in request_texts]
+            embed_batch_size.observe('sentence', len(texts))
+            try:
+                embeddings = self.model.encode(texts, batch_size=self.max_batch, normalize_embeddings=False)
+                embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+            except Exception as e:
+                logger.exception("Embedding batch of %d texts failed", len(texts))
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, future, _ in batch:
+                future.set_result(embeddings[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+class Embedder:
+    """
+    Shared front for the sentence model with the same encode() call.
+    Strings seen before come from an LRU cache; the rest are batched
+    together with those of concurrent requests before reaching the model
+    """
+    def __init__(self, model, backend='torch', cache_size=10000, max_batch=64, max_wait=0.002, workers=1):
+        self.model = model
+        self.backend = backend
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._batcher = _MicroBatcher(model, max_batch=max_batch, max_wait=max_wait, workers=workers)
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=True, **kwargs):
+        sentences = list(sentences)
+        if not sentences:
+            return self.model.encode(sentences, batch_size=batch_size, normalize_embeddings=normalize_embeddings)
+
+        vectors = [None] * len(sentences)
+        missing = OrderedDict()
+        with self._lock:
+            for row, text in enumerate(sentences):
+                vector = self._cache.get(text)
+                if vector is None:
+                    missing.setdefault(text, []).append(row)
+                else:
+                    self._cache.move_to_end(text)
+                    vectors[row] = vector
+
+        embedding_cache_events.inc('hit', len(sentences) - sum(len(rows) for rows in missing.values()))
+        if missing:
+            embedding_cache_events.inc('miss', len(missing))
+            embeddings = self._batcher.submit(list(missing)).result()
+            with self._lock:
+                for (text, rows), vector in zip(missing.items(), embeddings):
+                    for row in rows:
+                        vectors[row] = vector
+                    if self.cache_size:
+                        self._cache[text] = vector.copy()
+                        if len(self._cache) > self.cache_size:
+                            self._cache.popitem(last=False)
+
+        embeddings = np.stack(vectors)
+        if normalize_embeddings:
+            embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+    def stats(self):
+        events = embedding_cache_events.snapshot()
+        lookups = events.get('hit', 0) + events.get('miss', 0)
+        with self._lock:
+            entries = len(self._cache)
+        return {
+            'backend': self.backend,
+            'cache_entries': entries,
+            'cache_hits': events.get('hit', 0),
+            'cache_misses': events.get('miss', 0),
+            'cache_hit_rate': round(events.get('hit', 0) / lookups, 3) if lookups else None
+        }
@@ -0,0 +1,124 @@
+import logging
+
+from ocr_utils import iter_pdf_pages
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.pptx') + IMAGE_EXTENSIONS
+MAX_HEADING_CHARS = 80
+
+def _table_text(rows):
+    lines = []
+    for row in rows:
+        cells = []
+        for cell in row.cells:
+            text = " ".join(cell.text.split())
+            if not cells or cells[-1] != text:
+                cells.append(text)
+        if any(cells):
+            lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+def _docx_blocks(file_path):
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(file_path)
+    section = "document"
+    tables = 0
+    for element in document.element.body.iterchildren():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag == 'p':
+            paragraph = Paragraph(element, document)
+            text = paragraph.text
+            style = paragraph.style.name if paragraph.style is not None else ""
+            if style.startswith('Heading') or style == 'Title':
+                section = " ".join(text.split())[:MAX_HEADING_CHARS] or section
+            yield section, text
+        elif tag == 'tbl':
+            tables += 1
+            yield f"table {tables}", _table_text(Table(element, document).rows)
+
+def _shape_texts(shape):
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+    if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+        for child in shape.shapes:
+            yield from _shape_texts(child)
+    elif getattr(shape, 'has_table', False):
+        yield _table_text(shape.table.rows)
+    elif getattr(shape, 'has_text_frame', False):
+        yield shape.text_frame.text
+
+def _pptx_blocks(file_path):
+    import pptx
+
+    presentation = pptx.Presentation(file_path)
+    for number, slide in enumerate(presentation.slides, start=1):
+        for shape in slide.shapes:
+            for text in _shape_texts(shape):
+                yield f"slide {number}", text
+        if slide.has_notes_slide:
+            yield f"slide {number} notes", slide.notes_slide.notes_text_frame.text
+
+def _image_blocks(file_path):
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        yield "image", pytesseract.image_to_string(image)
+
+def _pdf_blocks(file_path, dpi, workers):
+    for number, text in iter_pdf_pages(file_path, dpi=dpi, workers=workers):
+        yield f"page {number}", text
+
+def iter_blocks(file_path, dpi=200, workers=None):
+    """
+    Yield (location, text) blocks in reading order: pages of a PDF, slides
+    (shapes, tables, groups and speaker notes) of a PPTX, paragraphs and
+    tables of a DOCX under their current heading
+    """
+    lower_path = file_path.lower()
+    logger.debug("Extracting text from: %s", lower_path)
+
+    if lower_path.endswith('.pdf'):
+        return _pdf_blocks(file_path, dpi, workers)
+    elif lower_path.endswith('.docx'):
+        return _docx_blocks(file_path)
+    elif lower_path.endswith('.pptx'):
+        return _pptx_blocks(file_path)
+    elif lower_path.endswith(IMAGE_EXTENSIONS):
+        return _image_blocks(file_path)
+    else:
+        raise ValueError("Unsupported file type")
+
+def extract_blocks(file_path, dpi=200, workers=None, max_bytes=None):
+    """
+    Like iter_blocks, skipping empty blocks and stopping once max_bytes of
+    UTF-8 text have been produced, so huge files cannot exhaust memory
+    """
+    blocks = iter_blocks(file_path, dpi, workers)
+    total = 0
+    try:
+        for location, text in blocks:
+            text = text.strip()
+            if not text:
+                continue
+
+            size = len(text.encode('utf-8')) + 1
+            if max_bytes and total + size > max_bytes:
+                remaining = max_bytes - total
+                if remaining > 1:
+                    yield location, text.encode('utf-8')[:remaining - 1].decode('utf-8', 'ignore')
+                logger.warning("Extraction of %s stopped at %s: %d byte limit reached", file_path, location, max_bytes)
+                return
+
+            total += size
+            yield location, text
+    finally:
+        blocks.close()
+
+def blocks_text(blocks):
+    return "\n".join(text for _, text in blocks)
@@ -0,0 +1,10 @@
+import os
+
+# One process serving the ASGI front (asgi_app.py explains its threads)
+# so all sessions share one copy of the models.
+wsgi_app = 'asgi_app:create_asgi_app()'
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_WORKERS', 1))
+worker_class = 'uvicorn_worker.UvicornWorker'
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+keepalive = 5
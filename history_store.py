@@ -0,0 +1,149 @@
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+HISTORY_HEADER = "Our recent conversation:\n"
+
+def render_turn(user, assistant):
+    return f"You: {user}\nAssistant: {assistant}\n"
+
+class _Session:
+    def __init__(self, context_turns):
+        self.turns = deque(maxlen=context_turns)
+        self.touched_at = time.time()
+
+class MemoryHistoryStore:
+    """
+    In-process history with LRU eviction across sessions and a TTL per session
+    """
+    def __init__(self, max_sessions=1000, ttl=3600, context_turns=5, max_message_chars=2000):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.context_turns = context_turns
+        self.max_message_chars = max_message_chars
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def append(self, user_id, user, assistant):
+        if not user_id:
+            return
+
+        turn = render_turn(user[:self.max_message_chars], assistant[:self.max_message_chars])
+        with self._lock:
+            session = self._get(user_id)
+            if session is None:
+                session = _Session(self.context_turns)
+                self._sessions[user_id] = session
+            session.turns.append(turn)
+            session.touched_at = time.time()
+            self._sessions.move_to_end(user_id)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def context(self, user_id):
+        with self._lock:
+            session = self._get(user_id)
+            if session is None or not session.turns:
+                return ""
+            return HISTORY_HEADER + "".join(session.turns)
+
+    def clear(self, user_id):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def _get(self, user_id):
+        session = self._sessions.get(user_id)
+        if session is not None and time.time() - session.touched_at > self.ttl:
+            del self._sessions[user_id]
+            return None
+        return session
+
+class SQLiteHistoryStore:
+    """
+    History shared between worker processes through a SQLite file
+    """
+    def __init__(self, path, ttl=3600, context_turns=5, max_turns=20, max_message_chars=2000):
+        self.path = path
+        self.ttl = ttl
+        self.context_turns = context_turns
+        self.max_turns = max_turns
+        self.max_message_chars = max_message_chars
+        self._local = threading.local()
+        self._appends = 0
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                rendered TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS turns_user ON turns (user_id, id)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def append(self, user_id, user, assistant):
+        if not user_id:
+            return
+
+        turn = render_turn(user[:self.max_message_chars], assistant[:self.max_message_chars])
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO turns (user_id, created_at, rendered) VALUES (?, ?, ?)",
+                (user_id, time.time(), turn)
+            )
+            conn.execute(
+                """DELETE FROM turns WHERE user_id = ? AND id NOT IN (
+                    SELECT id FROM turns WHERE user_id = ? ORDER BY id DESC LIMIT ?
+                )""",
+                (user_id, user_id, self.max_turns)
+            )
+
+        self._appends += 1
+        if self._appends % 100 == 0:
+            self.expire()
+
+    def context(self, user_id):
+        rows = self._conn().execute(
+            "SELECT rendered FROM turns WHERE user_id = ? AND created_at > ? ORDER BY id DESC LIMIT ?",
+            (user_id, time.time() - self.ttl, self.context_turns)
+        ).fetchall()
+        if not rows:
+            return ""
+        return HISTORY_HEADER + "".join(row[0] for row in reversed(rows))
+
+    def clear(self, user_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM turns WHERE user_id = ?", (user_id,))
+
+    def expire(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM turns WHERE created_at < ?", (time.time() - self.ttl,))
+
+def create_history_store(config):
+    """
+    Build the history store selected by HISTORY_BACKEND ('memory' or 'sqlite')
+    """
+    backend = config.get('HISTORY_BACKEND', 'memory')
+    ttl = config.get('HISTORY_TTL', 3600)
+
+    if backend == 'sqlite':
+        return SQLiteHistoryStore(config.get('HISTORY_DB', 'history.db'), ttl=ttl)
+    if backend == 'memory':
+        return MemoryHistoryStore(max_sessions=config.get('HISTORY_MAX_SESSIONS', 1000), ttl=ttl)
+
+    raise ValueError(f"Unknown history backend: {backend}")
@@ -0,0 +1,180 @@
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, user_id, stages):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = 'queued'
+        self.stages = {name: 'pending' for name in stages}
+        self.results = {}
+        self.timings = {}
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self._cancelled = threading.Event()
+        self._stage_started = {}
+        self._lock = threading.Lock()
+
+    def start_stage(self, name):
+        self.check_cancelled()
+        with self._lock:
+            self.stages[name] = 'running'
+            self._stage_started[name] = time.perf_counter()
+
+    def finish_stage(self, name, **results):
+        elapsed = None
+        with self._lock:
+            self.stages[name] = 'done'
+            self.results.update(results)
+            if name in self._stage_started:
+                elapsed = time.perf_counter() - self._stage_started[name]
+                self.timings[name] = round(elapsed, 3)
+        if elapsed is not None:
+            observe_stage(name, elapsed)
+
+    def add_results(self, **results):
+        with self._lock:
+            self.results.update(results)
+
+    def finish_all(self, **results):
+        with self._lock:
+            for name in self.stages:
+                self.stages[name] = 'done'
+            self.results.update(results)
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'stages': dict(self.stages),
+                'results': dict(self.results),
+                'timings': dict(self.timings),
+                'error': self.error
+            }
+
+class JobStore:
+    """
+    Runs background jobs on a local thread pool with a bounded backlog
+    """
+    def __init__(self, max_workers=2, max_pending=16, ttl=3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.jobs = {}
+        self._latest = {}
+        self._publish_locks = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user_id, stages, fn, *args):
+        with self._lock:
+            self._expire()
+            pending = sum(1 for job in self.jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                raise QueueFullError("Too many documents are being processed, please try again shortly")
+
+            job = Job(user_id, stages)
+            self.jobs[job.id] = job
+            self._latest[user_id] = job.id
+
+        job.future = self.executor.submit(self._run, job, fn, *args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+
+        job._cancelled.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, 'cancelled')
+        return True
+
+    def cancel_for_user(self, user_id):
+        with self._lock:
+            job_ids = [job.id for job in self.jobs.values() if job.user_id == user_id]
+        for job_id in job_ids:
+            self.cancel(job_id)
+
+    def user_lock(self, user_id):
+        """
+        Lock serializing writes to a user's per-user state
+        """
+        with self._lock:
+            return self._publish_locks.setdefault(user_id, threading.Lock())
+
+    @contextmanager
+    def publishing(self, job):
+        """
+        Hold the user's lock while a job writes its results into per-user
+        state. Raises JobCancelled instead if the job was cancelled or a
+        newer job has been submitted for the same user since, so a slow job
+        can never overwrite the results of a later upload
+        """
+        with self.user_lock(job.user_id):
+            job.check_cancelled()
+            with self._lock:
+                latest = self._latest.get(job.user_id)
+            if latest != job.id:
+                raise JobCancelled()
+            yield
+
+    def _run(self, job, fn, *args):
+        if job._cancelled.is_set():
+            self._finish(job, 'cancelled')
+            return
+
+        job.status = 'running'
+        try:
+            fn(job, *args)
+            self._finish(job, 'completed')
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.error = str(e)
+            self._finish(job, 'failed')
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+
+    def _expire(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished and now - job.finished_at > self.ttl
+        ]
+        for job_id in expired:
+            job = self.jobs.pop(job_id)
+            if self._latest.get(job.user_id) == job_id:
+                del self._latest[job.user_id]
+                self._publish_locks.pop(job.user_id, None)
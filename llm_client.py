@@ -0,0 +1,183 @@
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from backend_limits import Slots
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_ERRORS = {
+    'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded',
+    'InternalServerError', 'TooManyRequests', 'TimeoutError', 'ConnectionError'
+}
+
+class GeminiBackend:
+    def __init__(self, api_key, model_name):
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, timeout):
+        response = self.model.generate_content(prompt, request_options={'timeout': timeout})
+        return response.text
+
+    async def stream(self, prompt, timeout):
+        response = await self.model.generate_content_async(prompt, stream=True, request_options={'timeout': timeout})
+        async for chunk in response:
+            yield chunk.text or ""
+
+class StubBackend:
+    """
+    Deterministic offline stand-in for Gemini, for load tests and local runs
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def _words(self, prompt):
+        words = re.findall(r'[A-Za-z]{5,}', prompt)
+        return words or ['document']
+
+    def generate(self, prompt, timeout):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._reply(prompt)
+
+    def _reply(self, prompt):
+        seed = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+        words = self._words(prompt)
+        pick = lambda i: words[(seed >> (i * 8)) % len(words)]
+
+        if 'JSON' in prompt:
+            return json.dumps([
+                {
+                    "question": f"What does the content say about {pick(i)} and {pick(i + 5)}?",
+                    "option": [pick(i), pick(i + 1), pick(i + 2), pick(i + 3)],
+                    "answer": pick(i),
+                    "explanation": f"The content describes {pick(i)}.",
+                    "difficulty": ["easy", "medium", "hard"][i % 3],
+                    "taxonomy_level": "knowledge",
+                    "format": "mcq"
+                }
+                for i in range(5)
+            ])
+
+        return (
+            f"This material is mainly about {pick(0)} and {pick(1)}. "
+            f"It also touches on {pick(2)}. "
+            f"Would you like to know more about {pick(3)}?"
+        )
+
+    async def stream(self, prompt, timeout):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for piece in re.split(r'(?<=\s)', self._reply(prompt)):
+            yield piece
+
+class LLMClient:
+    """
+    Shared text-generation client: one configured backend, per-call
+    timeouts, bounded concurrency, retries and an optional prompt cache
+    """
+    def __init__(self, backend, timeout=60, max_concurrency=8, retries=2, cache_size=128):
+        self.backend = backend
+        self.timeout = timeout
+        self.retries = retries
+        self.cache_size = cache_size
+        self._slots = Slots(max_concurrency)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def generate(self, prompt, cache=False):
+        key = hashlib.sha256(prompt.encode('utf-8')).hexdigest() if cache and self.cache_size else None
+        if key:
+            with self._cache_lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    return self._cache[key]
+
+        text = self._with_retries(lambda: self.backend.generate(prompt, self.timeout))
+
+        if key:
+            with self._cache_lock:
+                self._cache[key] = text
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return text
+
+    async def stream(self, prompt):
+        """
+        Yield the reply's text as it is generated. Transient errors before
+        the first chunk are retried like generate(); once text has been
+        yielded they are raised. Shares the concurrency limit with generate()
+        """
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                async with self._slots:
+                    chunks = self.backend.stream(prompt, self.timeout)
+                    try:
+                        async for text in chunks:
+                            started = True
+                            yield text
+                    finally:
+                        await chunks.aclose()
+                return
+            except Exception as e:
+                if started or not self._retryable(e, attempt):
+                    raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def _retryable(self, error, attempt):
+        if attempt == self.retries or type(error).__name__ not in TRANSIENT_ERRORS:
+            return False
+        logger.warning("LLM call failed (%s), retrying", type(error).__name__)
+        return True
+
+    def _with_retries(self, call):
+        for attempt in range(self.retries + 1):
+            try:
+                with self._slots:
+                    return call()
+            except Exception as e:
+                if not self._retryable(e, attempt):
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+
+_client = None
+_client_lock = threading.Lock()
+
+def init_llm_client(config):
+    """
+    Build the shared client from LLM_* settings in the app config
+    """
+    global _client
+    with _client_lock:
+        backend_name = config.get('LLM_BACKEND', 'gemini')
+        if backend_name == 'gemini':
+            backend = GeminiBackend(config.get('GOOGLE_API_KEY'), config.get('LLM_MODEL', 'models/gemini-2.0-flash'))
+        elif backend_name == 'stub':
+            backend = StubBackend(latency=config.get('LLM_STUB_LATENCY', 0.0))
+        else:
+            raise ValueError(f"Unknown LLM backend: {backend_name}")
+
+        _client = LLMClient(
+            backend,
+            timeout=config.get('LLM_TIMEOUT', 60),
+            max_concurrency=config.get('LLM_MAX_CONCURRENCY', 8),
+            retries=config.get('LLM_RETRIES', 2),
+            cache_size=config.get('LLM_CACHE_SIZE', 128)
+        )
+        return _client
+
+def get_llm_client():
+    if _client is None:
+        raise RuntimeError("LLM client has not been initialised")
+    return _client
@@ -0,0 +1,143 @@
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+from flask import request, g, Response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram keyed by a single label
+    """
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][index] += 1
+            series['sum'] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {'counts': list(s['counts']), 'sum': s['sum']} for key, s in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for value, series in sorted(self.snapshot().items()):
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series['counts']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {series["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return lines
+
+class Counter:
+    """
+    Monotonic count keyed by a single label
+    """
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for value, count in sorted(self.snapshot().items()):
+            lines.append(f'{self.name}{{{self.label}="{_escape(value)}"}} {count}')
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+stage_seconds = Histogram(
+    'sylvie_stage_seconds', 'Time spent in each processing stage.', 'stage'
+)
+request_seconds = Histogram(
+    'sylvie_request_seconds', 'Time to produce an HTTP response, by route.', 'endpoint'
+)
+backend_wait_seconds = Histogram(
+    'sylvie_backend_wait_seconds', 'Time spent waiting for a free backend slot.', 'backend'
+)
+embed_batch_size = Histogram(
+    'sylvie_embed_batch_size', 'Texts encoded per embedding model call.', 'model',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+embedding_cache_events = Counter(
+    'sylvie_embedding_cache_events_total', 'Embedding cache lookups per text, by result.', 'result'
+)
+answer_cache_events = Counter(
+    'sylvie_answer_cache_events_total', 'Semantic answer cache lookups and updates, by result.', 'result'
+)
+
+_registry = [
+    stage_seconds, request_seconds, backend_wait_seconds, embed_batch_size,
+    embedding_cache_events, answer_cache_events
+]
+
+def observe_stage(stage, seconds):
+    stage_seconds.observe(stage, seconds)
+    logger.debug("Stage %s took %.3fs", stage, seconds)
+
+@contextmanager
+def timed(stage):
+    """
+    Record how long the enclosed block takes under the given stage name
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def register_metrics(app):
+    """
+    Time every request by route and serve all histograms at /metrics
+    """
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            request_seconds.observe(f"{request.method} {endpoint}", time.perf_counter() - started)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
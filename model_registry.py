@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+import resource
+import threading
+
+from embedding_utils import Embedder, load_sentence_model, BACKENDS
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+_embedding_settings = {
+    'backend': 'torch',
+    'onnx_file': None,
+    'cache_size': 10000,
+    'max_batch': 64,
+    'max_wait': 0.002,
+    'workers': 2
+}
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def configure_models(config):
+    """
+    Pick the embedding backend and embedder settings from EMBED_* config
+    """
+    backend = config.get('EMBED_BACKEND', 'torch')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    _embedding_settings.update(
+        backend=backend,
+        onnx_file=config.get('EMBED_ONNX_FILE') or None,
+        cache_size=config.get('EMBED_CACHE_SIZE', 10000),
+        max_batch=config.get('EMBED_MAX_BATCH', 64),
+        max_wait=config.get('EMBED_MAX_WAIT_MS', 2) / 1000,
+        workers=config.get('EMBED_MAX_CONCURRENCY', 2)
+    )
+
+def _load_sentence_model():
+    return load_sentence_model(
+        SENTENCE_MODEL_NAME, _embedding_settings['backend'], _embedding_settings['onnx_file']
+    )
+
+_loaders = {
+    'sentence': _load_sentence_model,
+}
+
+_models = {}
+_stats = {}
+_locks = {name: threading.Lock() for name in _loaders}
+
+def get_model(name):
+    """
+    Return a shared model instance, loading it on first use
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _locks[name]:
+        if name not in _models:
+            logger.info("Loading model: %s", name)
+            started = time.perf_counter()
+            model = _loaders[name]()
+            _stats[name] = {
+                'load_seconds': round(time.perf_counter() - started, 3),
+                'memory_bytes': _model_memory(model),
+                'loaded_at': time.time()
+            }
+            _models[name] = model
+        return _models[name]
+
+def get_sentence_model():
+    """
+    The shared Embedder in front of the sentence model, which callers use
+    exactly like the model itself
+    """
+    global _embedder
+    if _embedder is None:
+        model = get_model('sentence')
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = Embedder(
+                    model,
+                    backend=_embedding_settings['backend'],
+                    cache_size=_embedding_settings['cache_size'],
+                    max_batch=_embedding_settings['max_batch'],
+                    max_wait=_embedding_settings['max_wait'],
+                    workers=_embedding_settings['workers']
+                )
+    return _embedder
+
+def is_loaded(name):
+    return name in _models
+
+def is_warm():
+    return all(is_loaded(name) for name in _loaders)
+
+def warm_up(names=None):
+    """
+    Load the given models (all registered models by default)
+    """
+    for name in names or _loaders:
+        try:
+            get_model(name)
+        except Exception:
+            logger.exception("Warm-up failed for model: %s", name)
+
+def _tensor_bytes(value):
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    if hasattr(value, 'element_size'):
+        return value.numel() * value.element_size()
+    return 0
+
+def _model_memory(model):
+    """
+    Bytes of model weights. Dynamically quantized layers keep theirs as
+    packed params, which state_dict() lists but parameters() does not;
+    ONNX Runtime models hold no torch weights, so their model files count
+    """
+    try:
+        total = sum(_tensor_bytes(value) for value in model.state_dict().values())
+        for module in model.modules():
+            model_path = getattr(getattr(module, 'auto_model', None), 'model_path', None)
+            if model_path is None:
+                continue
+            for path in (model_path, f"{model_path}_data", f"{model_path}.data"):
+                if os.path.isfile(path):
+                    total += os.path.getsize(path)
+        return total
+    except Exception:
+        return None
+
+def diagnostics():
+    """
+    Load state, load time and parameter memory of each registered model
+    """
+    models = {}
+    for name in _loaders:
+        info = {'loaded': is_loaded(name)}
+        info.update(_stats.get(name, {}))
+        models[name] = info
+
+    return {
+        'models': models,
+        'embeddings': _embedder.stats() if _embedder is not None else {'backend': _embedding_settings['backend']},
+        'process_max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    }
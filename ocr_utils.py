@@ -0,0 +1,172 @@
+import os
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+MIN_TEXT_LAYER_CHARS = 50
+MAX_PAGES_PER_TASK = 4
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+def default_workers():
+    return max(1, os.cpu_count() or 1)
+
+def _start_pool(workers):
+    """
+    Processes are started by a forkserver (spawn where there is none),
+    since forking this heavily threaded process could deadlock the child
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    logger.debug("Starting OCR pool with %d processes", workers)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+def _get_pool(workers):
+    """
+    The OCR process pool shared by every upload, started on first use and
+    restarted when the number of workers changes or the pool has broken
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = _start_pool(workers)
+            _pool_workers = workers
+        return _pool
+
+def _discard_pool(pool):
+    """
+    Drop a broken pool so the next _get_pool starts a new one
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+def _ocr_pages(file_path, first, last, dpi):
+    """
+    Render pages first to last and OCR them, in a pool process, so only
+    text crosses the pipe
+    """
+    import pdf2image
+    import pytesseract
+    images = pdf2image.convert_from_path(file_path, dpi=dpi, first_page=first, last_page=last)
+    return [pytesseract.image_to_string(image) for image in images]
+
+def read_text_layer(file_path):
+    """
+    Return the embedded text of each page, or '' where a page has none
+    """
+    try:
+        import pdfplumber
+        with pdfplumber.open(file_path) as pdf:
+            return [(page.extract_text() or "") for page in pdf.pages]
+    except Exception as e:
+        logger.debug("Could not read PDF text layer: %s", e)
+        return []
+
+def iter_pdf_pages(file_path, dpi=200, workers=None):
+    """
+    Yield (page_number, text) in page order, skipping OCR for pages that
+    already have a usable text layer. The rest are OCRed on the shared
+    pool of workers processes in runs of up to MAX_PAGES_PER_TASK pages,
+    with at most two tasks per process queued for this file. If a pool
+    process dies, the unfinished tasks are retried once on a new pool.
+    Closing the generator early cancels the queued tasks
+    """
+    workers = workers or default_workers()
+
+    text_layer = read_text_layer(file_path)
+    if text_layer:
+        page_count = len(text_layer)
+    else:
+        import pdf2image
+        page_count = pdf2image.pdfinfo_from_path(file_path)["Pages"]
+
+    def embedded(number):
+        return text_layer[number - 1] if number <= len(text_layer) else ""
+
+    pending = [
+        number for number in range(1, page_count + 1)
+        if len(embedded(number).strip()) < MIN_TEXT_LAYER_CHARS
+    ]
+
+    logger.debug("PDF pages: %d, OCR needed: %d", page_count, len(pending))
+
+    if not pending:
+        for number in range(1, page_count + 1):
+            yield number, embedded(number)
+        return
+
+    pool = _get_pool(workers)
+    pages_per_task = max(1, min(MAX_PAGES_PER_TASK, -(-len(pending) // workers)))
+    tasks = deque(
+        (first, min(first + pages_per_task - 1, last))
+        for first, last in _page_ranges(pending)
+        for first in range(first, last + 1, pages_per_task)
+    )
+
+    needs_ocr = set(pending)
+    recognized = {}
+    in_flight = deque()
+    next_page = 1
+    retried = False
+    try:
+        with timed('ocr'):
+            while tasks or in_flight:
+                try:
+                    while tasks and len(in_flight) < workers * 2:
+                        first, last = tasks[0]
+                        in_flight.append((first, last, pool.submit(_ocr_pages, file_path, first, last, dpi)))
+                        tasks.popleft()
+
+                    first, _, future = in_flight[0]
+                    pages = future.result()
+                except BrokenProcessPool:
+                    _discard_pool(pool)
+                    if retried:
+                        raise
+                    retried = True
+                    logger.warning("OCR pool broke while reading %s, retrying on a new pool", file_path)
+                    tasks.extendleft(reversed([(first, last) for first, last, _ in in_flight]))
+                    in_flight.clear()
+                    pool = _get_pool(workers)
+                    continue
+
+                in_flight.popleft()
+                for number, text in enumerate(pages, start=first):
+                    recognized[number] = text
+
+                while next_page <= page_count and (next_page not in needs_ocr or next_page in recognized):
+                    yield next_page, recognized.pop(next_page) if next_page in needs_ocr else embedded(next_page)
+                    next_page += 1
+    finally:
+        for _, _, future in in_flight:
+            future.cancel()
+
+    # Pages the renderer did not return come out empty rather than stalling the rest
+    for number in range(next_page, page_count + 1):
+        yield number, recognized.pop(number, "") if number in needs_ocr else embedded(number)
+
+def _page_ranges(numbers):
+    """
+    Collapse sorted page numbers into contiguous (first, last) ranges
+    """
+    ranges = []
+    for number in numbers:
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ranges
@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+MAX_REDUCE_ROUNDS = 3
+FITTED_CACHE_SIZE = 32
+
+_stats = {}
+_stats_lock = threading.Lock()
+_fitted = OrderedDict()
+_fitted_lock = threading.Lock()
+
+def estimate_tokens(text):
+    """
+    Rough token count for Gemini-style tokenizers (~4 characters per token)
+    """
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def record_prompt(name, prompt):
+    """
+    Count the size of a prompt sent for the named call site
+    """
+    tokens = estimate_tokens(prompt)
+    with _stats_lock:
+        stats = _stats.setdefault(name, {'calls': 0, 'prompt_tokens': 0, 'max_prompt_tokens': 0})
+        stats['calls'] += 1
+        stats['prompt_tokens'] += tokens
+        stats['max_prompt_tokens'] = max(stats['max_prompt_tokens'], tokens)
+    logger.debug("Prompt %s: ~%d tokens", name, tokens)
+    return prompt
+
+def prompt_stats():
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+def split_chunks(text, max_tokens):
+    """
+    Split text into pieces of at most max_tokens, preferring paragraph breaks
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = ""
+    for paragraph in text.split("\n"):
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        if len(current) + len(paragraph) + 1 > max_chars and current:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+def trim_document(text, budget):
+    """
+    Keep the head and tail of a document so it fits the token budget
+    """
+    max_chars = budget * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return f"{text[:head]}\n...\n{text[-tail:]}"
+
+def _map_reduce(text, budget, summarize, workers):
+    for _ in range(MAX_REDUCE_ROUNDS):
+        if estimate_tokens(text) <= budget:
+            return text
+        chunks = split_chunks(text, budget)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            summaries = list(executor.map(summarize, chunks))
+        text = "\n".join(summary.strip() for summary in summaries if summary)
+    return trim_document(text, budget)
+
+def fit_document(text, budget, strategy='trim', summarize=None, workers=4):
+    """
+    Shrink a document to roughly budget tokens, either by trimming or by
+    summarizing chunks and combining the summaries (map-reduce)
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+
+    key = (hashlib.sha256(text.encode('utf-8')).hexdigest(), budget, strategy)
+    with _fitted_lock:
+        if key in _fitted:
+            _fitted.move_to_end(key)
+            return _fitted[key]
+
+    if strategy == 'map_reduce' and summarize is not None:
+        fitted = _map_reduce(text, budget, summarize, workers)
+    else:
+        fitted = trim_document(text, budget)
+
+    logger.debug("Document fitted from ~%d to ~%d tokens (%s)", estimate_tokens(text), estimate_tokens(fitted), strategy)
+
+    with _fitted_lock:
+        _fitted[key] = fitted
+        if len(_fitted) > FITTED_CACHE_SIZE:
+            _fitted.popitem(last=False)
+    return fitted
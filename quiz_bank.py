@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from quiz_utils import encode_questions, dedup_questions, count_unseen
+from async_utils import iter_blocking
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+MAX_DOCUMENTS = 64
+MAX_QUESTIONS_PER_DOCUMENT = 300
+AVOID_RECENT = 30
+SIMILARITY_THRESHOLD = 0.85
+TAGS = ('difficulty', 'taxonomy_level', 'format')
+MIXED = {tag: 'mixed' for tag in TAGS}
+
+_banks = OrderedDict()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='quiz-bank')
+_draining = set()
+
+class _Bank:
+    def __init__(self):
+        self.items = []
+        self.embeddings = None
+        self.refilling = {}
+        self.lock = threading.Lock()
+
+    def matching(self, filters):
+        with self.lock:
+            rows = [
+                row for row, item in enumerate(self.items)
+                if all(value == 'mixed' or item.get(tag) == value for tag, value in filters.items())
+            ]
+            items = [self.items[row] for row in rows]
+            embeddings = self.embeddings[rows] if rows else None
+        return items, embeddings
+
+    def recent_questions(self, limit):
+        with self.lock:
+            return [item['question'] for item in self.items[-limit:]]
+
+def _bank(key):
+    with _lock:
+        bank = _banks.get(key)
+        if bank is None:
+            bank = _banks[key] = _Bank()
+            if len(_banks) > MAX_DOCUMENTS:
+                _banks.popitem(last=False)
+        else:
+            _banks.move_to_end(key)
+        return bank
+
+def _normalize(item):
+    item = dict(item)
+    item['question'] = str(item.get('question', '')).strip()
+    for tag in TAGS:
+        item[tag] = str(item.get(tag, '')).strip().lower()
+    return item
+
+def _add(key, items, model):
+    bank = _bank(key)
+    items = [_normalize(item) for item in items if isinstance(item, dict)]
+
+    with bank.lock:
+        known = {item['question'].lower() for item in bank.items}
+    fresh = []
+    for item in items:
+        if item['question'] and item['question'].lower() not in known:
+            known.add(item['question'].lower())
+            fresh.append(item)
+    if not fresh:
+        return [], None
+
+    embeddings = encode_questions(model, [item['question'] for item in fresh])
+
+    with bank.lock:
+        allowed = np.ones(len(fresh), dtype=bool)
+        if bank.embeddings is not None and len(bank.embeddings):
+            allowed = (embeddings @ bank.embeddings.T).max(axis=1) <= SIMILARITY_THRESHOLD
+
+        similarity = embeddings @ embeddings.T
+        kept = []
+        for i in range(len(fresh)):
+            if allowed[i] and not (kept and similarity[i, kept].max() > SIMILARITY_THRESHOLD):
+                kept.append(i)
+        if not kept:
+            return [], None
+
+        bank.items.extend(fresh[i] for i in kept)
+        new_embeddings = embeddings[kept]
+        bank.embeddings = new_embeddings if bank.embeddings is None else np.concatenate([bank.embeddings, new_embeddings])
+
+        if len(bank.items) > MAX_QUESTIONS_PER_DOCUMENT:
+            bank.items = bank.items[-MAX_QUESTIONS_PER_DOCUMENT:]
+            bank.embeddings = bank.embeddings[-MAX_QUESTIONS_PER_DOCUMENT:]
+
+    logger.debug("Quiz bank %s: added %d questions, %d total", key[:12], len(kept), len(bank.items))
+    return [fresh[i] for i in kept], new_embeddings
+
+def add_questions(key, items, model):
+    """
+    Add generated questions to a document's bank, skipping repeats and
+    paraphrases of questions already in it. Returns how many were added
+    """
+    added, _ = _add(key, items, model)
+    return len(added)
+
+def _refill(key, generate, model, filters):
+    try:
+        existing = _bank(key).recent_questions(AVOID_RECENT)
+        return add_questions(key, list(iter_blocking(generate(filters, existing))), model)
+    except Exception:
+        logger.exception("Quiz bank refill failed")
+        raise
+
+def request_refill(key, generate, model, filters):
+    """
+    Generate a batch of questions matching filters into the bank in the
+    background. generate(filters, existing) is an async iterator of quiz
+    items, given the bank's most recent questions to avoid. Returns the
+    future of the refill already running for the same filters, if any
+    """
+    bank = _bank(key)
+    marker = tuple(sorted(filters.items()))
+    with bank.lock:
+        future = bank.refilling.get(marker)
+        if future is None or future.done():
+            future = bank.refilling[marker] = _executor.submit(_refill, key, generate, model, filters)
+    return future
+
+def _pick(key, user_id, model, filters, count, previous_questions):
+    """
+    The bank's questions matching filters, and up to count of them that
+    the user has not seen
+    """
+    items, embeddings = _bank(key).matching(filters)
+    if not items:
+        return items, []
+    with timed('dedup'):
+        return items, dedup_questions(
+            user_id, items, model, embeddings=embeddings, limit=count,
+            previous_questions=previous_questions
+        )
+
+def _offer(key, user_id, item, model, previous_questions):
+    """
+    Bank one freshly generated question and return it, unless the bank or
+    the user has already seen it or a paraphrase of it
+    """
+    added, added_embeddings = _add(key, [item], model)
+    if not added:
+        return []
+    with timed('dedup'):
+        return dedup_questions(
+            user_id, added, model, embeddings=added_embeddings,
+            previous_questions=previous_questions
+        )
+
+def serve(key, user_id, generate, model, filters, count=5, low_water=10, previous_questions=()):
+    """
+    Up to count banked questions matching filters that the user has not
+    seen yet. Generates on the calling thread only when the bank has none
+    to give, and tops the bank up in the background when it runs low
+    """
+    items, picked = _pick(key, user_id, model, filters, count, previous_questions)
+    if not picked:
+        _refill(key, generate, model, filters)
+        items, picked = _pick(key, user_id, model, filters, count, previous_questions)
+
+    if count_unseen(user_id, items) < low_water:
+        request_refill(key, generate, model, filters)
+
+    return picked
+
+async def _drain(key, generated, model):
+    try:
+        items = [item async for item in generated]
+        await asyncio.to_thread(add_questions, key, items, model)
+    except Exception:
+        logger.exception("Quiz bank refill failed")
+
+async def serve_stream(key, user_id, generate, model, filters, count=5, low_water=10, previous_questions=()):
+    """
+    Like serve, but yields questions one at a time. Unseen banked questions
+    go out first; if there are fewer than count, new ones are generated and
+    each is banked, checked against what the user has seen and yielded as
+    soon as the model finishes writing it. Whatever the model produces
+    after that still goes into the bank, in the background
+    """
+    items, picked = await asyncio.to_thread(_pick, key, user_id, model, filters, count, previous_questions)
+    for question in picked:
+        yield question
+
+    sent = len(picked)
+    if sent >= count:
+        if await asyncio.to_thread(count_unseen, user_id, items) < low_water:
+            await asyncio.to_thread(request_refill, key, generate, model, filters)
+        return
+
+    generated = generate(filters, _bank(key).recent_questions(AVOID_RECENT))
+    finished = False
+    try:
+        async for item in generated:
+            for question in await asyncio.to_thread(_offer, key, user_id, item, model, previous_questions):
+                yield question
+                sent += 1
+            if sent >= count:
+                break
+        else:
+            finished = True
+    finally:
+        if not finished:
+            task = asyncio.ensure_future(_drain(key, generated, model))
+            _draining.add(task)
+            task.add_done_callback(_draining.discard)
@@ -0,0 +1,191 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import timed
+from stream_utils import iter_json_array
+
+logger = logging.getLogger(__name__)
+
+MAX_USERS = 1000
+MAX_QUESTIONS_PER_USER = 500
+
+_histories = OrderedDict()
+_lock = threading.Lock()
+
+class _QuestionHistory:
+    def __init__(self):
+        self.questions = []
+        self.embeddings = None
+        self.pending = []
+        # Held while deduping for this user, encoding included; _lock only
+        # guards _histories, so other users' dedups are not held up
+        self.lock = threading.Lock()
+
+    def known(self):
+        return {q.lower() for q in self.questions + self.pending}
+
+    def encode_pending(self, model):
+        if not self.pending:
+            return
+        new_embeddings = encode_questions(model, self.pending)
+        self._append(self.pending, new_embeddings)
+        self.pending = []
+
+    def _append(self, questions, embeddings):
+        self.questions.extend(questions)
+        if self.embeddings is None:
+            self.embeddings = embeddings
+        else:
+            self.embeddings = np.concatenate([self.embeddings, embeddings])
+
+        if len(self.questions) > MAX_QUESTIONS_PER_USER:
+            self.questions = self.questions[-MAX_QUESTIONS_PER_USER:]
+            self.embeddings = self.embeddings[-MAX_QUESTIONS_PER_USER:]
+
+def validate_question(item):
+    """
+    The quiz item with its fields tidied up, or None when it cannot be shown:
+    no question or answer, or a multiple choice question without options
+    """
+    if not isinstance(item, dict):
+        return None
+
+    question = str(item.get("question") or "").strip()
+    answer = item.get("answer")
+    if isinstance(answer, str):
+        answer = answer.strip()
+    if not question or answer in (None, "", []):
+        return None
+
+    options = item.get("option") or []
+    if not isinstance(options, list):
+        return None
+    question_format = str(item.get("format") or "mcq").strip().lower()
+    if question_format == "short_answer" and not options and isinstance(answer, str):
+        options = [answer]
+    if question_format not in ("true_false", "short_answer") and len(options) < 2:
+        return None
+
+    return dict(item, question=question, answer=answer, option=[str(option) for option in options])
+
+def _parse_item(text):
+    try:
+        item = validate_question(json.loads(text))
+    except ValueError as e:
+        logger.warning("Dropping malformed quiz item: %s", e)
+        return None
+    if item is None:
+        logger.warning("Dropping incomplete quiz item: %.80s", text)
+    return item
+
+async def parse_quiz_items(chunks):
+    """
+    Yield valid quiz items from a streamed JSON array as each one completes.
+    Malformed or incomplete items are logged and dropped one at a time
+    """
+    texts = iter_json_array(chunks)
+    try:
+        async for text in texts:
+            item = _parse_item(text)
+            if item is not None:
+                yield item
+    finally:
+        await texts.aclose()
+
+def encode_questions(model, texts):
+    with timed('embed'):
+        embeddings = model.encode(texts, batch_size=32, normalize_embeddings=True)
+    return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+def _history(user_id):
+    history = _histories.get(user_id)
+    if history is None:
+        history = _QuestionHistory()
+        _histories[user_id] = history
+        if len(_histories) > MAX_USERS:
+            _histories.popitem(last=False)
+    else:
+        _histories.move_to_end(user_id)
+    return history
+
+def reset_questions(user_id, questions=()):
+    """
+    Start a user's question history over, e.g. after a new upload.
+    Questions are encoded lazily on the next dedup.
+    """
+    with _lock:
+        history = _QuestionHistory()
+        history.pending = [q for q in questions if q]
+        _histories[user_id] = history
+        _histories.move_to_end(user_id)
+
+def count_unseen(user_id, items):
+    """
+    How many items the user has not been shown yet, by exact question text
+    """
+    with _lock:
+        history = _histories.get(user_id)
+    if history is None:
+        known = set()
+    else:
+        with history.lock:
+            known = history.known()
+    return sum(1 for item in items if str(item.get("question", "")).strip().lower() not in known)
+
+def dedup_questions(user_id, items, model, threshold=0.85, previous_questions=(), embeddings=None, limit=None):
+    """
+    Drop quiz items that repeat or paraphrase a question the user has
+    already seen, or another candidate earlier in the list. All
+    candidates are encoded in a single batch, unless embeddings (one row
+    per item) are passed in. Stops after limit items when given.
+    """
+    with _lock:
+        history = _history(user_id)
+
+    with history.lock:
+        known = history.known()
+        extra = [q for q in previous_questions if q and q.lower() not in known]
+        history.pending.extend(extra)
+        history.encode_pending(model)
+
+        seen = {q.lower() for q in history.questions}
+        candidates = []
+        rows = []
+        for row, item in enumerate(items):
+            question_text = str(item.get("question", "")).strip()
+            if not question_text or question_text.lower() in seen:
+                continue
+            seen.add(question_text.lower())
+            candidates.append((question_text, item))
+            rows.append(row)
+
+        if not candidates:
+            return []
+
+        if embeddings is None:
+            embeddings = encode_questions(model, [text for text, _ in candidates])
+        else:
+            embeddings = embeddings[rows]
+
+        allowed = np.ones(len(candidates), dtype=bool)
+        if history.embeddings is not None and len(history.embeddings):
+            allowed = (embeddings @ history.embeddings.T).max(axis=1) <= threshold
+
+        similarity = embeddings @ embeddings.T
+        kept = []
+        for i in range(len(candidates)):
+            if not allowed[i] or (kept and similarity[i, kept].max() > threshold):
+                logger.debug("Skipping semantically similar question: %s", candidates[i][0])
+                continue
+            kept.append(i)
+            if limit and len(kept) >= limit:
+                break
+
+        if kept:
+            history._append([candidates[i][0] for i in kept], embeddings[kept])
+
+        return [candidates[i][1] for i in kept]
@@ -0,0 +1,156 @@
+import os
+import threading
+import numpy as np
+
+from document_utils import SESSION_DIR
+from metrics import timed
+
+EMBED_BATCH_SIZE = 64
+
+_indexes = {}
+_lock = threading.Lock()
+
+def _index_path(user_id):
+    return os.path.join(SESSION_DIR, f"index_{user_id}.npz")
+
+def _location_span(first, last):
+    return first if first == last else f"{first} to {last}"
+
+def chunk_blocks(blocks, chunk_size=200, overlap=40):
+    """
+    Yield (location, chunk) windows of roughly chunk_size words over a stream
+    of (location, text) blocks, holding at most one window in memory. The
+    location names the block(s) the window was taken from
+    """
+    step = max(1, chunk_size - overlap)
+    window = []
+    emitted = False
+    for location, text in blocks:
+        window.extend((word, location) for word in text.split())
+        while len(window) >= chunk_size:
+            yield (
+                _location_span(window[0][1], window[chunk_size - 1][1]),
+                " ".join(word for word, _ in window[:chunk_size])
+            )
+            emitted = True
+            window = window[step:]
+
+    if window and (not emitted or len(window) > overlap):
+        yield _location_span(window[0][1], window[-1][1]), " ".join(word for word, _ in window)
+
+def chunk_text(text, chunk_size=200, overlap=40):
+    """
+    Split text into overlapping windows of roughly chunk_size words
+    """
+    return [chunk for _, chunk in chunk_blocks([("", text)], chunk_size, overlap)]
+
+def embed_blocks(blocks, model, chunk_size=200, overlap=40):
+    """
+    Chunk and embed (location, text) blocks in batches as the chunks are
+    produced. Returns (chunks, embeddings, locations), with embeddings None
+    for a document without text
+    """
+    chunks = []
+    locations = []
+    parts = []
+    for location, chunk in chunk_blocks(blocks, chunk_size, overlap):
+        chunks.append(chunk)
+        locations.append(location)
+        if len(chunks) % EMBED_BATCH_SIZE == 0:
+            parts.append(_embed(model, chunks[-EMBED_BATCH_SIZE:]))
+
+    if not chunks:
+        return chunks, None, locations
+
+    pending = len(chunks) % EMBED_BATCH_SIZE
+    if pending:
+        parts.append(_embed(model, chunks[-pending:]))
+    return chunks, np.concatenate(parts), locations
+
+def store_index(user_id, index):
+    """
+    Make an index from embed_blocks the user's current one
+    """
+    chunks, embeddings, locations = index
+    if not chunks:
+        clear_index(user_id)
+        return
+
+    with _lock:
+        _indexes[user_id] = (chunks, embeddings, locations)
+    np.savez(
+        _index_path(user_id),
+        chunks=np.array(chunks), embeddings=embeddings, locations=np.array(locations)
+    )
+
+def _embed(model, chunks):
+    with timed('embed'):
+        embeddings = model.encode(chunks, batch_size=32, normalize_embeddings=True)
+    return np.asarray(embeddings, dtype=np.float32).reshape(len(chunks), -1)
+
+def get_index(user_id):
+    """
+    Return (chunks, embeddings, locations) for a user, loading from disk if needed
+    """
+    with _lock:
+        if user_id in _indexes:
+            return _indexes[user_id]
+
+    path = _index_path(user_id)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path, allow_pickle=False) as data:
+        chunks = data['chunks'].tolist()
+        locations = data['locations'].tolist() if 'locations' in data else [""] * len(chunks)
+        index = (chunks, data['embeddings'], locations)
+
+    with _lock:
+        _indexes[user_id] = index
+    return index
+
+def retrieve(user_id, query, model, k=4):
+    """
+    Return (location, chunk) for the top-k chunks most similar to the query,
+    in document order
+    """
+    index = get_index(user_id)
+    if index is None:
+        return []
+
+    chunks, embeddings, locations = index
+    with timed('embed'):
+        query_embedding = model.encode([query], normalize_embeddings=True)[0]
+    scores = embeddings @ np.asarray(query_embedding, dtype=np.float32)
+
+    k = min(k, len(chunks))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return [(locations[i], chunks[i]) for i in sorted(top)]
+
+def build_context(user_id, query, document_content, model, k=4, full_text_max_words=600):
+    """
+    Pick the document context for a chat turn: the full text for short
+    documents, otherwise only the chunks relevant to the query
+    """
+    if not document_content or not document_content.strip():
+        return ""
+
+    if len(document_content.split()) <= full_text_max_words:
+        return document_content
+
+    chunks = retrieve(user_id, query, model, k)
+    if not chunks:
+        return document_content
+
+    return "\n...\n".join(f"[{location}] {chunk}" if location else chunk for location, chunk in chunks)
+
+def clear_index(user_id):
+    """
+    Drop a user's index from memory and disk
+    """
+    with _lock:
+        _indexes.pop(user_id, None)
+
+    path = _index_path(user_id)
+    if os.path.exists(path):
+        os.remove(path)
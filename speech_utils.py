@@ -0,0 +1,152 @@
+import io
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from metrics import timed
+from backend_limits import limited
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+NOISE_SAMPLE_MS = 300
+SILENCE_MARGIN_DB = 6
+MAX_SESSIONS = 1000
+
+UNDERSTAND_ERROR = "Sorry, I couldn't understand your audio. Please try speaking more clearly."
+SERVICE_ERROR = "Sorry, there was an issue with the speech recognition service."
+DECODE_ERROR = "Sorry, I couldn't process your audio file. Please ensure it's a valid audio format."
+
+CONTENT_TYPE_FORMATS = (
+    ('mp3', 'mp3'),
+    ('mpeg', 'mp3'),
+    ('mp4', 'mp4'),
+    ('webm', 'webm'),
+    ('ogg', 'ogg'),
+    ('wav', 'wav'),
+)
+
+_noise_floors = OrderedDict()
+_noise_lock = threading.Lock()
+
+def _recognize_google(recognizer, audio_data):
+    return recognizer.recognize_google(audio_data)
+
+def _recognize_sphinx(recognizer, audio_data):
+    return recognizer.recognize_sphinx(audio_data)
+
+def _recognize_stub(recognizer, audio_data):
+    return os.getenv('STT_STUB_TEXT', 'What is this document about?')
+
+_backends = {
+    'google': _recognize_google,
+    'sphinx': _recognize_sphinx,
+    'stub': _recognize_stub,
+}
+
+def register_backend(name, recognize):
+    """
+    Register a recognizer: recognize(recognizer, audio_data) returns text or
+    raises sr.UnknownValueError / sr.RequestError
+    """
+    _backends[name] = recognize
+
+def get_backends():
+    names = [name.strip() for name in os.getenv('STT_BACKENDS', 'google,sphinx').split(',') if name.strip()]
+    unknown = [name for name in names if name not in _backends]
+    if unknown:
+        raise ValueError(f"Unknown speech recognition backend: {', '.join(unknown)}")
+    return names
+
+def audio_format(content_type):
+    content_type = (content_type or '').lower()
+    for marker, fmt in CONTENT_TYPE_FORMATS:
+        if marker in content_type:
+            return fmt
+    return None
+
+def noise_floor(session_key, audio):
+    """
+    Noise floor in dBFS for a session, measured once from the start of
+    the first clip and reused afterwards
+    """
+    with _noise_lock:
+        if session_key in _noise_floors:
+            _noise_floors.move_to_end(session_key)
+            return _noise_floors[session_key]
+
+    floor = audio[:NOISE_SAMPLE_MS].dBFS
+    if floor == float('-inf'):
+        floor = -60.0
+
+    if session_key:
+        with _noise_lock:
+            _noise_floors[session_key] = floor
+            if len(_noise_floors) > MAX_SESSIONS:
+                _noise_floors.popitem(last=False)
+    return floor
+
+def decode_audio(data, content_type=None, session_key=None):
+    """
+    Decode an uploaded clip once into 16 kHz mono PCM wrapped in sr.AudioData
+    """
+    import speech_recognition as sr
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(io.BytesIO(data), format=audio_format(content_type))
+    audio = audio.set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(SAMPLE_WIDTH)
+    audio = audio.normalize()
+
+    silence_thresh = noise_floor(session_key, audio) + SILENCE_MARGIN_DB
+    audio = audio.strip_silence(silence_thresh=silence_thresh)
+
+    return sr.AudioData(audio.raw_data, SAMPLE_RATE, SAMPLE_WIDTH)
+
+def _read_wav(data):
+    import speech_recognition as sr
+    with sr.AudioFile(io.BytesIO(data)) as source:
+        return sr.Recognizer().record(source)
+
+def recognize(audio_data, timeout=None):
+    """
+    Try each configured backend in turn, giving up on a slow one after timeout
+    """
+    import speech_recognition as sr
+
+    recognizer = sr.Recognizer()
+    recognizer.operation_timeout = timeout
+
+    message = UNDERSTAND_ERROR
+    for name in get_backends():
+        try:
+            with limited('stt'):
+                text = _backends[name](recognizer, audio_data)
+            logger.debug("%s transcription: %s", name, text)
+            return text
+        except sr.UnknownValueError:
+            message = UNDERSTAND_ERROR
+        except Exception as e:
+            logger.warning("%s speech recognition error: %s", name, e)
+            message = SERVICE_ERROR
+
+    return message
+
+def transcribe(data, content_type=None, session_key=None, timeout=None):
+    """
+    Transcribe an uploaded clip entirely in memory
+    """
+    logger.debug("Audio file size: %d bytes", len(data))
+    with timed('transcribe'):
+        try:
+            audio_data = decode_audio(data, content_type, session_key)
+        except Exception as e:
+            logger.debug("Audio processing error: %s", e)
+            try:
+                audio_data = _read_wav(data)
+            except Exception as fallback_error:
+                logger.warning("Fallback audio processing error: %s", fallback_error)
+                return DECODE_ERROR
+
+        return recognize(audio_data, timeout)
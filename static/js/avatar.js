@@ -1,23 +1,16 @@
 import { TalkingHead } from "talkinghead";
 
 let head;
-let documentContext = { extracted_content: "", explanation: "" };
-let lastDocumentHash = ""; 
+let documentContext = { extracted_content: "", explanation: "", version: null };
+let documentEtag = null;
 
 document.addEventListener('DOMContentLoaded', async function () {
     const avatarContainer = document.getElementById('avatar-container');
     const loadingIndicator = document.getElementById('avatar-loading');
 
     try {
-        const contextResponse = await fetch('/avatar/context');
-        if (contextResponse.ok) {
-            documentContext = await contextResponse.json();
-            console.log("Retrieved document context:", documentContext.extracted_content ? "Yes" : "No");
-            
-            if (documentContext.extracted_content) {
-                lastDocumentHash = simpleHash(documentContext.extracted_content);
-            }
-        }
+        await fetchDocumentContext();
+        console.log("Retrieved document context:", documentContext.extracted_content ? "Yes" : "No");
     } catch (error) {
         console.error("Error fetching document context:", error);
     }
@@ -67,46 +60,75 @@ document.addEventListener('DOMContentLoaded', async function () {
     setupDocumentRefresh();
 });
 
-function simpleHash(str) {
-    if (!str) return "empty";
-    
-    let hash = 0;
-    for (let i = 0; i < str.length; i++) {
-        const char = str.charCodeAt(i);
-        hash = ((hash << 5) - hash) + char;
-        hash = hash & hash; 
+async function fetchDocumentContext() {
+    const headers = documentEtag ? { 'If-None-Match': documentEtag } : {};
+    const contextResponse = await fetch('/avatar/context', { headers });
+
+    if (contextResponse.status === 304 || !contextResponse.ok) {
+        return false;
     }
-    return String(hash);
+
+    documentContext = await contextResponse.json();
+    documentEtag = contextResponse.headers.get('ETag');
+    return true;
 }
 
 function setupDocumentRefresh() {
-    setInterval(async () => {
+    const watchForChanges = async () => {
         try {
-            const contextResponse = await fetch('/avatar/context');
-            if (contextResponse.ok) {
-                const newContext = await contextResponse.json();
-                
-                if (!newContext.extracted_content) {
-                    documentContext = newContext;
-                    return;
-                }
-                
-                const newHash = simpleHash(newContext.extracted_content);
-                if (newHash !== lastDocumentHash) {
+            const since = documentContext.version || '';
+            const changeResponse = await fetch(`/avatar/context/changes?since=${encodeURIComponent(since)}`);
+
+            if (changeResponse.status === 200) {
+                const changed = await fetchDocumentContext();
+
+                if (changed && documentContext.extracted_content && documentContext.extracted_content.trim() !== "") {
                     console.log("Document context has changed, updating...");
-                    documentContext = newContext;
-                    lastDocumentHash = newHash;
-                    
-                    if (newContext.extracted_content && newContext.extracted_content.trim() !== "") {
-                        head.speakText("I've just received a new document. Feel free to ask me questions about it.");
-                        addMessageToChat('assistant', "I've just received a new document. Feel free to ask me questions about it.");
-                    }
+                    head.speakText("I've just received a new document. Feel free to ask me questions about it.");
+                    addMessageToChat('assistant', "I've just received a new document. Feel free to ask me questions about it.");
                 }
+            } else if (changeResponse.status !== 204) {
+                throw new Error(`Unexpected status ${changeResponse.status}`);
             }
+
+            watchForChanges();
         } catch (error) {
             console.error("Error refreshing document context:", error);
+            setTimeout(watchForChanges, 5000);
         }
-    }, 5000);
+    };
+
+    watchForChanges();
+}
+
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = "";
+            rawEvent.split("\n").forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+
+            onEvent(event, data ? JSON.parse(data) : {});
+        }
+    }
 }
 
 function setupBackButton() {
@@ -221,6 +243,8 @@ function setupChatInteraction() {
                 formData.append('type', 'audio');
             }
 
+            formData.append('stream', '1');
+
             const randomThinking = thinkingPhrases[Math.floor(Math.random() * thinkingPhrases.length)];
             const loadingMessage = addMessageToChat('assistant', randomThinking);
 
@@ -229,26 +253,48 @@ function setupChatInteraction() {
                 body: formData
             });
 
-            loadingMessage.remove();
-
-            if (response.ok) {
-                const data = await response.json();
-
-                if (data.text && data.text.trim() !== "") {
-                    addMessageToChat('assistant', data.text);
-                    try {
-                        setTimeout(() => {
-                            head.speakText(data.text);
-                        }, 300);
-                    } catch (speakError) {
-                        console.error("TTS failed:", speakError);
-                    }
-                } else {
-                    addMessageToChat('assistant', "Sorry, I didn't get a proper response.");
+            if (!response.ok) {
+                loadingMessage.remove();
+                addMessageToChat('assistant', "Sorry, I couldn't process your request.");
+                return;
+            }
+
+            let replyMessage = null;
+            let replyText = "";
+            let streamFailed = false;
+
+            await readEventStream(response, (event, data) => {
+                if (event === 'transcript') {
+                    return;
+                }
+                if (event === 'error') {
+                    streamFailed = true;
+                    loadingMessage.remove();
+                    addMessageToChat('assistant', data.error || "Sorry, I couldn't process your request.");
+                    return;
+                }
+                if (event !== 'message' || !data.text) {
+                    return;
                 }
 
-            } else {
-                addMessageToChat('assistant', "Sorry, I couldn't process your request.");
+                if (!replyMessage) {
+                    loadingMessage.remove();
+                    replyMessage = addMessageToChat('assistant', '');
+                }
+                replyText = replyText ? `${replyText} ${data.text}` : data.text;
+                replyMessage.querySelector('.message-content').textContent = replyText;
+                chatHistoryContainer.scrollTop = chatHistoryContainer.scrollHeight;
+
+                try {
+                    head.speakText(data.text);
+                } catch (speakError) {
+                    console.error("TTS failed:", speakError);
+                }
+            });
+
+            if (!replyMessage && !streamFailed) {
+                loadingMessage.remove();
+                addMessageToChat('assistant', "Sorry, I didn't get a proper response.");
             }
         } catch (error) {
             console.error("Chat processing error:", error);
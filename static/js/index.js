@@ -2,6 +2,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const uploadForm = document.getElementById('upload-form');
     const fileUpload = document.getElementById('file-upload');
     const uploadButton = document.getElementById('upload-button');
+    const cancelUploadButton = document.getElementById('cancel-upload');
     const loadingSpinner = document.getElementById('loading-spinner');
     const uploadStatus = document.getElementById('upload-status');
     const resultContainer = document.getElementById('result-container');
@@ -20,6 +21,16 @@ document.addEventListener('DOMContentLoaded', function() {
     let currentQuiz = [];
     let extractedText = '';
     let quizAnswers = [];
+    let currentJobId = null;
+    let audioSegments = [];
+    let audioSegmentIndex = 0;
+    
+    const stageLabels = {
+        extract: 'Extracting text',
+        explain: 'Writing explanation',
+        tts: 'Generating audio',
+        quiz: 'Building quiz'
+    };
     
     checkSessionData();
     
@@ -31,13 +42,18 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        const file = fileUpload.files[0];
+        const files = Array.from(fileUpload.files);
         const formData = new FormData();
-        formData.append('file', file);
+        if (files.length > 1) {
+            files.forEach(file => formData.append('files', file));
+        } else {
+            formData.append('file', files[0]);
+        }
         
         startLoading();
+        resetQuiz();
         
-        fetch('/upload', {
+        fetch(files.length > 1 ? '/upload/batch' : '/upload', {
             method: 'POST',
             body: formData
         })
@@ -50,8 +66,9 @@ document.addEventListener('DOMContentLoaded', function() {
             return response.json();
         })
         .then(data => {
-            stopLoading();
-            displayResults(data);
+            currentJobId = data.job_id;
+            cancelUploadButton.style.display = 'inline-block';
+            pollJob(data.job_id);
         })
         .catch(error => {
             stopLoading();
@@ -59,6 +76,138 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    cancelUploadButton.addEventListener('click', function() {
+        if (!currentJobId) {
+            return;
+        }
+        
+        fetch(`/jobs/${currentJobId}`, { method: 'DELETE' })
+            .catch(error => {
+                console.error('Error cancelling upload:', error);
+            });
+    });
+    
+    function pollJob(jobId) {
+        if (jobId !== currentJobId) {
+            return;
+        }
+        
+        fetch(`/jobs/${jobId}`)
+            .then(response => response.json().then(data => {
+                if (!response.ok) {
+                    throw new Error(data.error || 'Upload failed');
+                }
+                return data;
+            }))
+            .then(job => {
+                if (job.status === 'completed') {
+                    finishJob();
+                    uploadStatus.style.display = 'none';
+                    displayResults(job.results);
+                    return;
+                }
+                if (job.status === 'failed') {
+                    throw new Error(job.error || 'Processing failed');
+                }
+                if (job.status === 'cancelled') {
+                    throw new Error('Processing was cancelled.');
+                }
+                
+                showUploadStatus(describeStages(job.stages), 'alert-info');
+                displayPartialResults(job.results);
+                setTimeout(() => pollJob(jobId), 1000);
+            })
+            .catch(error => {
+                finishJob();
+                showUploadStatus(error.message, 'alert-danger');
+            });
+    }
+    
+    function setAudioSegments(segments) {
+        if (!segments.length) {
+            return;
+        }
+        
+        const sameAudio = audioSegments.length && audioSegments[0] === segments[0];
+        audioSegments = segments;
+        
+        if (!sameAudio) {
+            audioSegmentIndex = 0;
+            explanationAudio.src = segments[0];
+        }
+    }
+    
+    explanationAudio.addEventListener('ended', function() {
+        if (audioSegmentIndex < audioSegments.length - 1) {
+            audioSegmentIndex++;
+            explanationAudio.src = audioSegments[audioSegmentIndex];
+            explanationAudio.play();
+        }
+    });
+    
+    function finishJob() {
+        currentJobId = null;
+        cancelUploadButton.style.display = 'none';
+        stopLoading();
+    }
+    
+    function describeStages(stages) {
+        return Object.keys(stageLabels)
+            .map(name => {
+                const status = stages[name];
+                const mark = status === 'done' ? '\u2713' : (status === 'running' ? '\u2026' : '\u2022');
+                return `${mark} ${stageLabels[name]}`;
+            })
+            .join('   ');
+    }
+    
+    function displayPartialResults(results) {
+        if (results.extracted_text) {
+            extractedText = results.extracted_text;
+            rawText.textContent = results.extracted_text;
+        }
+        if (results.explanation) {
+            explanationText.textContent = results.explanation;
+        }
+        setAudioSegments(results.audio_segments || (results.audio_file ? [results.audio_file] : []));
+        if (results.quiz) {
+            appendNewQuestions(JSON.parse(results.quiz));
+        }
+        if (results.extracted_text || results.explanation) {
+            resultContainer.style.display = 'block';
+        }
+    }
+    
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+                
+                onEvent(event, data ? JSON.parse(data) : {});
+            }
+        }
+    }
+    
     function checkSessionData() {
         fetch('/get_session_data')
             .then(response => response.json())
@@ -100,15 +249,15 @@ document.addEventListener('DOMContentLoaded', function() {
         
         explanationText.textContent = data.explanation;
         
-        if (data.audio_file) {
-            explanationAudio.src = data.audio_file;
-        }
+        setAudioSegments(data.audio_segments || (data.audio_file ? [data.audio_file] : []));
         
         rawText.textContent = data.extracted_text;
         
         try {
-            currentQuiz = JSON.parse(data.quiz);
-            generateQuizUI(currentQuiz);
+            appendNewQuestions(JSON.parse(data.quiz));
+            if (!currentQuiz.length) {
+                throw new Error('Quiz has no questions');
+            }
         } catch (error) {
             console.error('Error parsing quiz JSON:', error);
             quizContainer.innerHTML = '<div class="alert alert-warning">Unable to generate quiz for this document.</div>';
@@ -119,69 +268,78 @@ document.addEventListener('DOMContentLoaded', function() {
         resultContainer.scrollIntoView({ behavior: 'smooth' });
     }
     
-    function generateQuizUI(quizData) {
+    function resetQuiz() {
         quizContainer.innerHTML = '';
+        currentQuiz = [];
         quizAnswers = [];
+        checkAnswersBtn.disabled = false;
+    }
+    
+    function appendNewQuestions(quizData) {
+        quizData.slice(currentQuiz.length).forEach(appendQuestion);
+    }
+    
+    function appendQuestion(question) {
+        const index = currentQuiz.length;
+        currentQuiz.push(question);
         
-        quizData.forEach((question, index) => {
-            const questionEl = document.createElement('div');
-            questionEl.className = 'quiz-question';
-            
-            let badgesHTML = '';
-            if (question.difficulty) {
-                const badgeClass = getBadgeClass(question.difficulty);
-                badgesHTML += `<span class="badge ${badgeClass} me-2">${question.difficulty}</span>`;
-            }
-            
-            if (question.taxonomy_level) {
-                badgesHTML += `<span class="badge bg-info me-2">${question.taxonomy_level}</span>`;
-            }
-            
-            if (question.format) {
-                badgesHTML += `<span class="badge bg-primary me-2">${question.format}</span>`;
-            }
-            
-            const badgesDiv = badgesHTML ? `<div class="mb-2">${badgesHTML}</div>` : '';
-            
-            questionEl.innerHTML = `
-                <h5>${index + 1}. ${question.question}</h5>
-                ${badgesDiv}
-                <div class="quiz-options" id="options-${index}"></div>
-                <div class="quiz-feedback alert" id="feedback-${index}"></div>
-            `;
-            
-            quizContainer.appendChild(questionEl);
+        const questionEl = document.createElement('div');
+        questionEl.className = 'quiz-question';
+        
+        let badgesHTML = '';
+        if (question.difficulty) {
+            const badgeClass = getBadgeClass(question.difficulty);
+            badgesHTML += `<span class="badge ${badgeClass} me-2">${question.difficulty}</span>`;
+        }
+        
+        if (question.taxonomy_level) {
+            badgesHTML += `<span class="badge bg-info me-2">${question.taxonomy_level}</span>`;
+        }
+        
+        if (question.format) {
+            badgesHTML += `<span class="badge bg-primary me-2">${question.format}</span>`;
+        }
+        
+        const badgesDiv = badgesHTML ? `<div class="mb-2">${badgesHTML}</div>` : '';
+        
+        questionEl.innerHTML = `
+            <h5>${index + 1}. ${question.question}</h5>
+            ${badgesDiv}
+            <div class="quiz-options" id="options-${index}"></div>
+            <div class="quiz-feedback alert" id="feedback-${index}"></div>
+        `;
+        
+        quizContainer.appendChild(questionEl);
+        
+        const optionsContainer = document.getElementById(`options-${index}`);
+        
+        const format = question.format || 'mcq';
+        
+        if (format === 'true_false') {
+            ['True', 'False'].forEach((option, optIndex) => {
+                createOptionElement(optionsContainer, option, index, optIndex);
+            });
+        } else if (format === 'short_answer') {
+            const inputGroup = document.createElement('div');
+            inputGroup.className = 'input-group mb-3';
             
-            const optionsContainer = document.getElementById(`options-${index}`);
+            const input = document.createElement('input');
+            input.type = 'text';
+            input.className = 'form-control';
+            input.id = `short-answer-${index}`;
+            input.placeholder = 'Type your answer here';
             
-            const format = question.format || 'mcq';
+            input.addEventListener('input', function() {
+                quizAnswers[index] = this.value.trim();
+            });
             
-            if (format === 'true_false') {
-                ['True', 'False'].forEach((option, optIndex) => {
-                    createOptionElement(optionsContainer, option, index, optIndex);
-                });
-            } else if (format === 'short_answer') {
-                const inputGroup = document.createElement('div');
-                inputGroup.className = 'input-group mb-3';
-                
-                const input = document.createElement('input');
-                input.type = 'text';
-                input.className = 'form-control';
-                input.id = `short-answer-${index}`;
-                input.placeholder = 'Type your answer here';
-                
-                input.addEventListener('input', function() {
-                    quizAnswers[index] = this.value.trim();
-                });
-                
-                inputGroup.appendChild(input);
-                optionsContainer.appendChild(inputGroup);
-            } else {
-                question.option.forEach((option, optIndex) => {
-                    createOptionElement(optionsContainer, option, index, optIndex);
-                });
-            }
-        });
+            inputGroup.appendChild(input);
+            optionsContainer.appendChild(inputGroup);
+        } else {
+            question.option.forEach((option, optIndex) => {
+                createOptionElement(optionsContainer, option, index, optIndex);
+            });
+        }
     }
     
     function createOptionElement(container, option, questionIndex, optionIndex) {
@@ -316,9 +474,8 @@ document.addEventListener('DOMContentLoaded', function() {
         const taxonomy = taxonomySelect.value;
         const format = formatSelect.value;
         
-        const previousQuestions = currentQuiz.map(q => q.question);
-        
         quizLoadingSpinner.classList.remove('d-none');
+        let started = false;
         
         fetch('/generate_quiz', {
             method: 'POST',
@@ -327,38 +484,38 @@ document.addEventListener('DOMContentLoaded', function() {
             },
             body: JSON.stringify({
                 extracted_text: extractedText,
-                previous_questions: previousQuestions,
                 difficulty: difficulty,
                 taxonomy: taxonomy,
-                format: format
+                format: format,
+                stream: true
             })
         })
-        .then(response => response.json())
-        .then(data => {
-            quizLoadingSpinner.classList.add('d-none');
-            
-            if (data.error) {
-                throw new Error(data.error);
+        .then(response => {
+            if (!response.ok) {
+                return response.json().then(data => {
+                    throw new Error(data.error || 'Failed to generate new questions. Please try again.');
+                });
             }
             
-            try {
-                const newQuiz = JSON.parse(data.quiz);
-                currentQuiz = newQuiz;
-                generateQuizUI(currentQuiz);
-                
-                checkAnswersBtn.disabled = false;
-                
-                const oldScoreAlert = quizContainer.querySelector('.alert.alert-info.mt-3');
-                if (oldScoreAlert) {
-                    oldScoreAlert.remove();
+            return readEventStream(response, (event, data) => {
+                if (event === 'error') {
+                    throw new Error(data.error);
+                }
+                if (event !== 'question') {
+                    return;
                 }
                 
-                document.getElementById('quiz-tab').click();
-                quizContainer.scrollIntoView({ behavior: 'smooth' });
-            } catch (error) {
-                console.error('Error parsing new quiz JSON:', error);
-                alert('Failed to generate new questions. Please try again.');
-            }
+                if (!started) {
+                    started = true;
+                    resetQuiz();
+                    document.getElementById('quiz-tab').click();
+                    quizContainer.scrollIntoView({ behavior: 'smooth' });
+                }
+                appendQuestion(data);
+            });
+        })
+        .then(() => {
+            quizLoadingSpinner.classList.add('d-none');
         })
         .catch(error => {
             quizLoadingSpinner.classList.add('d-none');
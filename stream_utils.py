@@ -0,0 +1,89 @@
+import json
+
+def sse_event(data, event=None):
+    """
+    Format one server-sent event carrying a JSON payload
+    """
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+class JsonArrayParser:
+    """
+    Incremental reader for a JSON array of objects arriving as text chunks.
+    feed() returns the text of each top-level object the chunk completes.
+    The array starts at the first '[' whose next non-blank character is
+    '{', so a markdown code fence or a preamble such as "Here are [5]
+    questions:" is skipped. Top-level values that are not objects are
+    skipped too
+    """
+    def __init__(self):
+        self.started = False
+        self.opening = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.current = []
+
+    def feed(self, chunk):
+        objects = []
+        for char in chunk:
+            if self.done:
+                break
+
+            if not self.started:
+                if self.opening and char == '{':
+                    self.started = True
+                elif self.opening and char.isspace():
+                    continue
+                else:
+                    self.opening = char == '['
+                    continue
+
+            if self.in_string:
+                if self.depth:
+                    self.current.append(char)
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                if not self.depth:
+                    self.done = True
+                    break
+                self.depth -= 1
+
+            if self.depth or char == '}':
+                self.current.append(char)
+            if not self.depth and self.current:
+                if self.current[0] == '{':
+                    objects.append(''.join(self.current))
+                self.current = []
+        return objects
+
+async def iter_json_array(chunks):
+    """
+    Yield the text of each top-level object in a JSON array as soon as its
+    closing brace arrives, reading the array from an async iterator of
+    text chunks (see JsonArrayParser). Stops reading at the end of the
+    array, and closes chunks
+    """
+    parser = JsonArrayParser()
+    try:
+        async for chunk in chunks:
+            for text in parser.feed(chunk):
+                yield text
+            if parser.done:
+                return
+    finally:
+        await chunks.aclose()
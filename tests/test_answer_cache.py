@@ -0,0 +1,37 @@
+import numpy as np
+
+from answer_cache import AnswerCache
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_follow_ups_are_only_shared_without_a_conversation():
+    cache = AnswerCache()
+    assert cache.cacheable("What is osmosis?", "")
+    assert cache.cacheable("Explain that again", "")
+    assert cache.cacheable("What is osmosis?", "Our recent conversation: ...")
+    assert not cache.cacheable("Explain that again", "Our recent conversation: ...")
+    assert cache.storable("") and not cache.storable("Our recent conversation: ...")
+    assert not AnswerCache(max_answers=0).cacheable("What is osmosis?", "")
+
+def test_lookup_needs_the_threshold_and_the_same_document():
+    cache = AnswerCache(threshold=0.9)
+    cache.store('doc', 'What is osmosis?', unit(1, 0), 'Water moving across a membrane.')
+
+    assert cache.lookup('doc', unit(1, 0.1)) == 'Water moving across a membrane.'
+    assert cache.lookup('doc', unit(1, 1)) is None
+    assert cache.lookup('other-doc', unit(1, 0)) is None
+
+def test_full_document_evicts_its_least_recently_used_answer():
+    cache = AnswerCache(threshold=0.99, max_answers=2)
+    cache.store('doc', 'a', unit(1, 0, 0), 'A')
+    cache.store('doc', 'b', unit(0, 1, 0), 'B')
+    cache.store('other-doc', 'c', unit(0, 0, 1), 'C')
+    assert cache.lookup('doc', unit(1, 0, 0)) == 'A'
+
+    cache.store('doc', 'd', unit(0, 0, 1), 'D')
+    assert cache.lookup('doc', unit(0, 1, 0)) is None
+    assert cache.lookup('doc', unit(1, 0, 0)) == 'A'
+    assert cache.lookup('doc', unit(0, 0, 1)) == 'D'
+    assert cache.lookup('other-doc', unit(0, 0, 1)) == 'C'
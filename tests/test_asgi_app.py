@@ -0,0 +1,129 @@
+import asyncio
+
+from flask import Flask, session, jsonify
+
+from asgi_app import AsyncFront, AsyncResponse, event_stream
+
+def create_app(log):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+
+    @app.route('/count')
+    def count():
+        session['count'] = session.get('count', 0) + 1
+        seen = session['count']
+
+        async def reply():
+            await asyncio.sleep(0)
+            return jsonify({'count': seen})
+        return AsyncResponse(reply=reply())
+
+    @app.route('/plain')
+    def plain():
+        return 'plain'
+
+    @app.route('/wait')
+    def wait():
+        async def reply():
+            log.append('reply')
+            return 'waited'
+        return AsyncResponse(reply=reply())
+
+    @app.route('/events')
+    def events():
+        async def produce():
+            try:
+                yield 'first\n'
+                await asyncio.sleep(10)
+                yield 'second\n'
+            finally:
+                log.append('closed')
+        return event_stream(produce())
+
+    @app.route('/finite')
+    def finite():
+        async def produce():
+            for word in ('one', 'two'):
+                yield f"{word}\n"
+        return event_stream(produce())
+
+    return app
+
+def request(front, method, path, headers=(), disconnect_after_body=False):
+    """
+    Drive one request through the ASGI front; returns status, headers
+    and body
+    """
+    started = {}
+    body = []
+
+    async def main():
+        first_chunk = asyncio.Event()
+        pending = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            if disconnect_after_body:
+                await first_chunk.wait()
+                return {'type': 'http.disconnect'}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                started.update(message)
+            else:
+                body.append(message.get('body', b''))
+                if message.get('body'):
+                    first_chunk.set()
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': b'', 'root_path': '', 'headers': list(headers),
+            'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+        }
+        await asyncio.wait_for(front(scope, receive, send), 5)
+
+    asyncio.run(main())
+    headers = {name.decode(): value.decode() for name, value in started['headers']}
+    return started['status'], headers, b''.join(body)
+
+def test_session_cookie_persists_from_an_async_response():
+    front = AsyncFront(create_app([]), threads=2)
+
+    status, headers, body = request(front, 'GET', '/count')
+    assert status == 200 and b'"count":1' in body
+    cookie = headers['set-cookie'].split(';')[0]
+
+    status, _, body = request(front, 'GET', '/count', headers=[(b'cookie', cookie.encode())])
+    assert status == 200 and b'"count":2' in body
+
+def test_plain_responses_pass_through():
+    front = AsyncFront(create_app([]), threads=2)
+    assert request(front, 'GET', '/plain')[::2] == (200, b'plain')
+
+def test_options_does_not_run_the_reply():
+    log = []
+    front = AsyncFront(create_app(log), threads=2)
+
+    status, headers, _ = request(front, 'OPTIONS', '/wait')
+    assert status == 200 and 'GET' in headers['allow']
+    assert log == []
+    assert request(front, 'GET', '/wait')[::2] == (200, b'waited')
+    assert log == ['reply']
+
+def test_disconnect_stops_the_event_stream():
+    log = []
+    front = AsyncFront(create_app(log), threads=2)
+
+    status, headers, body = request(front, 'GET', '/events', disconnect_after_body=True)
+    assert status == 200 and headers['content-type'].startswith('text/event-stream')
+    assert body == b'first\n'
+    assert log == ['closed']
+
+def test_wsgi_servers_get_the_same_replies():
+    client = create_app([]).test_client()
+    assert client.get('/count').get_json() == {'count': 1}
+    assert client.get('/count').get_json() == {'count': 2}
+    assert client.get('/finite').data == b'one\ntwo\n'
@@ -0,0 +1,72 @@
+import time
+import asyncio
+import threading
+
+from backend_limits import Slots
+
+def test_threads_and_tasks_share_the_limit():
+    slots = Slots(1)
+    slots.acquire()
+    order = []
+
+    async def waiter():
+        async with slots:
+            order.append('task')
+
+    def release_later():
+        time.sleep(0.05)
+        order.append('release')
+        slots.release()
+
+    threading.Thread(target=release_later).start()
+    asyncio.run(asyncio.wait_for(waiter(), 1))
+    assert order == ['release', 'task']
+    assert slots._free == 1
+
+def test_slots_are_handed_over_in_arrival_order():
+    slots = Slots(1)
+    order = []
+
+    async def worker(name):
+        async with slots:
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(worker(name) for name in 'abc'))
+
+    asyncio.run(main())
+    assert order == ['a', 'b', 'c']
+    assert slots._free == 1
+
+def test_cancelled_waiter_does_not_keep_a_slot():
+    slots = Slots(1)
+
+    async def main():
+        await slots.acquire_async()
+        waiting = asyncio.ensure_future(slots.acquire_async())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        slots.release()
+        await asyncio.sleep(0)
+        await asyncio.wait_for(slots.acquire_async(), 1)
+        slots.release()
+
+    asyncio.run(main())
+    assert slots._free == 1 and not slots._waiters
+
+def test_slot_handed_to_a_task_cancelled_before_it_ran_is_passed_on():
+    slots = Slots(1)
+
+    async def main():
+        await slots.acquire_async()
+        waiting = asyncio.ensure_future(slots.acquire_async())
+        await asyncio.sleep(0)
+        slots.release()
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        await asyncio.wait_for(slots.acquire_async(), 1)
+        slots.release()
+
+    asyncio.run(main())
+    assert slots._free == 1
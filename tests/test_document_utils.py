@@ -0,0 +1,21 @@
+import threading
+
+import document_utils
+
+def in_new_thread(function):
+    """
+    Run function on a thread of its own, so it opens its own connection
+    """
+    results = []
+    thread = threading.Thread(target=lambda: results.append(function()))
+    thread.start()
+    thread.join()
+    return results[0]
+
+def test_missing_document_has_every_requested_field(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_utils, 'DB_PATH', str(tmp_path / 'documents.db'))
+
+    assert in_new_thread(lambda: document_utils.get_document_field('nobody', 'quiz')) == ''
+    assert in_new_thread(lambda: document_utils.get_document_data('nobody')) == {
+        'extracted_content': '', 'explanation': '', 'quiz': ''
+    }
@@ -0,0 +1,44 @@
+import numpy as np
+
+from embedding_utils import Embedder, _MicroBatcher
+
+class RecordingModel:
+    """
+    Encodes text number n as the vector (n, 1) and records each call
+    """
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        self.calls.append(list(texts))
+        return np.array([[float(text.split()[-1]), 1.0] for text in texts], dtype=np.float32)
+
+def test_concurrent_requests_share_one_batch_in_order():
+    model = RecordingModel()
+    batcher = _MicroBatcher(model, max_batch=64, max_wait=0.5)
+
+    futures = [batcher.submit([f'text {i}', f'text {i + 10}']) for i in range(3)]
+    results = [future.result(5) for future in futures]
+
+    assert model.calls == [['text 0', 'text 10', 'text 1', 'text 11', 'text 2', 'text 12']]
+    for i, result in enumerate(results):
+        assert result[:, 0].tolist() == [i, i + 10]
+
+def test_batches_stop_at_max_batch():
+    model = RecordingModel()
+    batcher = _MicroBatcher(model, max_batch=2, max_wait=0.5)
+
+    futures = [batcher.submit([f'text {i}']) for i in range(3)]
+    assert [future.result(5)[0, 0] for future in futures] == [0, 1, 2]
+    assert model.calls == [['text 0', 'text 1'], ['text 2']]
+
+def test_embedder_encodes_each_new_string_once():
+    model = RecordingModel()
+    embedder = Embedder(model, max_wait=0)
+
+    first = embedder.encode(['text 3', 'text 4', 'text 3'], normalize_embeddings=False)
+    second = embedder.encode(['text 4', 'text 5'])
+
+    assert model.calls == [['text 3', 'text 4'], ['text 5']]
+    assert first[:, 0].tolist() == [3, 4, 3]
+    assert np.allclose(second, [[4, 1] / np.hypot(4, 1), [5, 1] / np.hypot(5, 1)])
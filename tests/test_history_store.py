@@ -0,0 +1,16 @@
+from history_store import SQLiteHistoryStore, HISTORY_HEADER, render_turn
+
+def test_sqlite_history_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'history.db')
+    writer = SQLiteHistoryStore(path, context_turns=2)
+    for i in range(3):
+        writer.append('user', f'question {i}', f'answer {i}')
+    writer.append('other', 'hello', 'hi')
+
+    reader = SQLiteHistoryStore(path, context_turns=2)
+    assert reader.context('user') == HISTORY_HEADER + render_turn('question 1', 'answer 1') + render_turn('question 2', 'answer 2')
+    assert reader.context('nobody') == ""
+
+    reader.clear('user')
+    assert writer.context('user') == ""
+    assert writer.context('other') == HISTORY_HEADER + render_turn('hello', 'hi')
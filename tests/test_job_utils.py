@@ -0,0 +1,23 @@
+import threading
+
+from job_utils import JobStore
+
+def test_stale_job_does_not_overwrite_a_newer_one():
+    store = JobStore(max_workers=2)
+    published = {}
+    release = threading.Event()
+
+    def upload(job, name, wait):
+        if wait:
+            release.wait(5)
+        with store.publishing(job):
+            published[job.user_id] = name
+
+    stale = store.submit('user', ('extract',), upload, 'stale', True)
+    newer = store.submit('user', ('extract',), upload, 'newer', False)
+    newer.future.result(5)
+    release.set()
+    stale.future.result(5)
+
+    assert published == {'user': 'newer'}
+    assert (stale.status, newer.status) == ('cancelled', 'completed')
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from llm_client import LLMClient
+
+class ServiceUnavailable(Exception):
+    pass
+
+class FlakyBackend:
+    """
+    Streams "a b " but fails with ServiceUnavailable on the first
+    `failures` attempts, after `fail_after` chunks
+    """
+    def __init__(self, failures, fail_after=0):
+        self.failures = failures
+        self.fail_after = fail_after
+        self.attempts = 0
+
+    async def stream(self, prompt, timeout):
+        self.attempts += 1
+        for i, text in enumerate(('a ', 'b ')):
+            if i == self.fail_after and self.attempts <= self.failures:
+                raise ServiceUnavailable()
+            yield text
+
+def collect(client):
+    async def main():
+        return ''.join([text async for text in client.stream('prompt')])
+    return asyncio.run(main())
+
+def test_stream_retries_failures_before_the_first_chunk():
+    backend = FlakyBackend(failures=1)
+    assert collect(LLMClient(backend, retries=1)) == 'a b '
+    assert backend.attempts == 2
+
+def test_stream_does_not_retry_once_text_was_sent():
+    backend = FlakyBackend(failures=1, fail_after=1)
+    with pytest.raises(ServiceUnavailable):
+        collect(LLMClient(backend, retries=1))
+    assert backend.attempts == 1
@@ -0,0 +1,48 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import ocr_utils
+
+class FakePool:
+    """
+    Runs nothing: every task either returns one line per page or fails
+    as if a pool process had died
+    """
+    def __init__(self, broken):
+        self.broken = broken
+        self.shut_down = False
+
+    def submit(self, function, file_path, first, last, dpi):
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool())
+        else:
+            future.set_result([f"page {number}" for number in range(first, last + 1)])
+        return future
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
+
+def use_pools(monkeypatch, *pools):
+    started = list(pools)
+    monkeypatch.setattr(ocr_utils, '_pool', None)
+    monkeypatch.setattr(ocr_utils, '_start_pool', lambda workers: started.pop(0))
+    monkeypatch.setattr(ocr_utils, 'read_text_layer', lambda file_path: [''] * 5)
+
+def test_broken_pool_is_replaced_and_the_file_retried(monkeypatch):
+    broken, fresh = FakePool(broken=True), FakePool(broken=False)
+    use_pools(monkeypatch, broken, fresh)
+
+    pages = list(ocr_utils.iter_pdf_pages('scan.pdf', workers=2))
+    assert pages == [(number, f"page {number}") for number in range(1, 6)]
+    assert broken.shut_down
+    assert ocr_utils._get_pool(2) is fresh
+
+def test_file_fails_when_the_new_pool_breaks_too(monkeypatch):
+    use_pools(monkeypatch, FakePool(broken=True), FakePool(broken=True), FakePool(broken=False))
+
+    with pytest.raises(BrokenProcessPool):
+        list(ocr_utils.iter_pdf_pages('scan.pdf', workers=2))
+    assert not ocr_utils._get_pool(2).broken
@@ -0,0 +1,61 @@
+import threading
+
+import numpy as np
+
+import quiz_bank
+from quiz_utils import reset_questions
+
+class OneHotModel:
+    """
+    Encodes each distinct text as its own one-hot vector, so no two
+    questions look like paraphrases
+    """
+    def __init__(self):
+        self.rows = {}
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vectors[row, self.rows.setdefault(text, len(self.rows))] = 1
+        return vectors
+
+def generator(questions, called):
+    """
+    generate() for the bank: sets called and yields one quiz item per
+    question
+    """
+    async def generate(filters, existing):
+        called.set()
+        for question in questions:
+            yield {'question': question, 'difficulty': 'easy'}
+    return generate
+
+def test_serve_does_not_wait_behind_background_refills():
+    reset_questions('inline-user')
+    release = threading.Event()
+    busy = [quiz_bank._executor.submit(release.wait, 5) for _ in range(2)]
+
+    try:
+        served = quiz_bank.serve(
+            'inline-doc', 'inline-user', generator(['Q1', 'Q2'], threading.Event()), OneHotModel(),
+            quiz_bank.MIXED, count=5, low_water=0
+        )
+        assert not any(future.done() for future in busy)
+    finally:
+        release.set()
+    assert [item['question'] for item in served] == ['Q1', 'Q2']
+
+def test_serve_gives_unseen_questions_and_refills_when_low():
+    reset_questions('bank-user')
+    model = OneHotModel()
+    quiz_bank.add_questions('bank-doc', [{'question': f'Q{i}'} for i in range(3)], model)
+    called = threading.Event()
+    generate = generator(['R1', 'R2'], called)
+
+    first = quiz_bank.serve('bank-doc', 'bank-user', generate, model, quiz_bank.MIXED, count=2, low_water=10)
+    assert [item['question'] for item in first] == ['Q0', 'Q1']
+    assert called.wait(5)
+
+    quiz_bank.request_refill('bank-doc', generate, model, quiz_bank.MIXED).result(5)
+    second = quiz_bank.serve('bank-doc', 'bank-user', generate, model, quiz_bank.MIXED, count=5, low_water=0)
+    assert [item['question'] for item in second] == ['Q2', 'R1', 'R2']
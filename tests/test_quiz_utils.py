@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from quiz_utils import parse_quiz_items, validate_question, dedup_questions, reset_questions
+
+def test_parse_quiz_items_drops_malformed_and_incomplete_items():
+    text = (
+        'Sure! Here are [3] questions:\n```json\n['
+        '{"question": "Q1", "option": ["a", "b"], "answer": "a"},'
+        '{"question": "Q2", "option": ["a", "b"], "answer": "a",},'
+        '{"question": "", "option": ["a", "b"], "answer": "a"},'
+        '{"question": "Q4", "option": "a", "answer": "a"},'
+        '{"question": "Q5", "option": ["True", "False"], "answer": "True", "format": "true_false"}'
+        ']\n```'
+    )
+    async def chunks():
+        for i in range(0, len(text), 5):
+            yield text[i:i + 5]
+
+    async def main():
+        return [item async for item in parse_quiz_items(chunks())]
+    items = asyncio.run(main())
+    assert [item['question'] for item in items] == ['Q1', 'Q5']
+
+def test_validate_question_short_answer_defaults_options():
+    item = validate_question({'question': 'Q', 'answer': 'A', 'format': 'short_answer'})
+    assert item['option'] == ['A']
+
+def test_validate_question_needs_two_options_for_mcq():
+    assert validate_question({'question': 'Q', 'answer': 'A', 'option': ['A']}) is None
+
+class BlockingModel:
+    """
+    Encodes each text as its own one-hot vector, blocking on release when
+    asked to encode a text containing "slow"
+    """
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.rows = {}
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        if any('slow' in text for text in texts):
+            self.started.set()
+            self.release.wait(5)
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vectors[row, self.rows.setdefault(text, len(self.rows))] = 1
+        return vectors
+
+def test_dedup_for_one_user_does_not_wait_for_another_users_encoding():
+    model = BlockingModel()
+    reset_questions('slow-user', ['slow question'])
+    reset_questions('other-user')
+
+    slow = threading.Thread(target=dedup_questions, args=('slow-user', [{'question': 'Q'}], model))
+    slow.start()
+    assert model.started.wait(5)
+
+    kept = []
+    other = threading.Thread(
+        target=lambda: kept.extend(dedup_questions('other-user', [{'question': 'A'}, {'question': 'A'}, {'question': 'B'}], model))
+    )
+    other.start()
+    other.join(2)
+    finished = not other.is_alive()
+    model.release.set()
+    slow.join()
+    other.join()
+
+    assert finished
+    assert [item['question'] for item in kept] == ['A', 'B']
+
+def test_dedup_remembers_what_the_user_was_shown():
+    model = BlockingModel()
+    reset_questions('user', ['Seen before'])
+    kept = dedup_questions('user', [{'question': 'seen before'}, {'question': 'New'}], model)
+    assert [item['question'] for item in kept] == ['New']
+    assert dedup_questions('user', [{'question': 'New'}], model) == []
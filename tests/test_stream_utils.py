@@ -0,0 +1,89 @@
+import json
+import asyncio
+
+from stream_utils import iter_json_array, JsonArrayParser
+
+def collect(chunks):
+    """
+    Run iter_json_array over chunks as if they were streamed
+    """
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    async def main():
+        return [item async for item in iter_json_array(stream())]
+    return asyncio.run(main())
+
+def parse(text, chunk_size=None):
+    """
+    Run iter_json_array over text, split into chunks of chunk_size
+    characters (one chunk by default), and decode each object
+    """
+    chunk_size = chunk_size or max(1, len(text))
+    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    return [json.loads(item) for item in collect(chunks)]
+
+def test_plain_array():
+    assert parse('[{"a": 1}, {"b": 2}]') == [{'a': 1}, {'b': 2}]
+
+def test_objects_complete_across_chunk_boundaries():
+    text = '[{"question": "Q1", "option": ["x", "y"]}, {"question": "Q2"}]'
+    for size in (1, 2, 3, 7):
+        assert parse(text, size) == [{'question': 'Q1', 'option': ['x', 'y']}, {'question': 'Q2'}]
+
+def test_objects_are_yielded_as_soon_as_they_close():
+    parser = JsonArrayParser()
+    assert parser.feed('[{"a": 1}, {"b"') == ['{"a": 1}']
+    assert parser.feed(': 2}') == ['{"b": 2}']
+    assert not parser.done
+    assert parser.feed(']') == []
+    assert parser.done
+
+def test_markdown_code_fence():
+    text = '```json\n[\n  {"a": 1},\n  {"b": 2}\n]\n```'
+    assert parse(text) == [{'a': 1}, {'b': 2}]
+
+def test_preamble_with_brackets():
+    text = 'Here are [5] questions: [{"a": 1}, {"b": 2}]'
+    assert parse(text) == [{'a': 1}, {'b': 2}]
+
+def test_preamble_with_empty_array_and_fence():
+    text = 'Skipping [] and [ ] first.\n```json\n[ {"a": 1} ]\n```'
+    assert parse(text, 4) == [{'a': 1}]
+
+def test_escapes_inside_strings():
+    text = r'[{"q": "say \"hi\" ]} {[", "path": "C:\\dir\\"}, {"b": "\\"}]'
+    assert parse(text) == [{'q': 'say "hi" ]} {[', 'path': 'C:\\dir\\'}, {'b': '\\'}]
+
+def test_escaped_quote_split_across_chunks():
+    text = r'[{"q": "a \"quoted\" word"}]'
+    assert parse(text, 1) == [{'q': 'a "quoted" word'}]
+
+def test_nested_arrays_and_objects():
+    text = '[{"option": [["a", "b"], []], "meta": {"tags": [{"x": 1}]}}, {"c": 3}]'
+    assert parse(text) == [{'option': [['a', 'b'], []], 'meta': {'tags': [{'x': 1}]}}, {'c': 3}]
+
+def test_top_level_values_that_are_not_objects_are_skipped():
+    assert parse('[{"a": 1}, "text {", 2, ["x"], null, {"b": 2}]') == [{'a': 1}, {'b': 2}]
+
+def test_malformed_item_does_not_drop_the_rest():
+    items = collect(['[{"a": 1,}, {"b": 2}, {c: 3}, {"d": 4}]'])
+    assert len(items) == 4
+    assert [json.loads(item) for item in (items[1], items[3])] == [{'b': 2}, {'d': 4}]
+
+def test_stops_reading_after_the_array():
+    async def chunks():
+        yield '[{"a": 1}]'
+        raise AssertionError("read past the end of the array")
+
+    async def main():
+        return [item async for item in iter_json_array(chunks())]
+    assert asyncio.run(main()) == ['{"a": 1}']
+
+def test_truncated_output_keeps_complete_items():
+    assert parse('[{"a": 1}, {"b": 2}, {"c": ') == [{'a': 1}, {'b': 2}]
+
+def test_no_array():
+    assert parse('Sorry, I cannot help with that.') == []
+    assert parse('Scores: [1, 2, 3]') == []
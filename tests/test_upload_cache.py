@@ -0,0 +1,24 @@
+import os
+import time
+
+import upload_cache
+
+def store(digest, audio_folder, segments, age=0):
+    upload_cache.store_cached_result(digest, {'audio_segments': segments}, audio_folder)
+    used = time.time() - age
+    os.utime(os.path.join(upload_cache.CACHE_DIR, f"{digest}.json"), (used, used))
+
+def test_evict_leaves_shared_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    os.makedirs(upload_cache.CACHE_DIR)
+    audio_folder = tmp_path / 'audio'
+    audio_folder.mkdir()
+    (audio_folder / 'shared.mp3').write_bytes(b'\0' * 1000)
+
+    store('old', str(audio_folder), ['shared.mp3'], age=60)
+    store('new', str(audio_folder), ['shared.mp3'])
+    upload_cache.evict(max_bytes=100, max_age=3600)
+
+    assert not os.path.exists(os.path.join(upload_cache.CACHE_DIR, 'old.json'))
+    assert (audio_folder / 'shared.mp3').exists()
+    assert upload_cache.get_cached_result('new', str(audio_folder)) is not None
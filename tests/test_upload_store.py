@@ -0,0 +1,31 @@
+import io
+import os
+import hashlib
+
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from upload_store import HashingFile, store_upload
+
+def test_hashing_file_digest_and_size_cap(tmp_path):
+    stored = HashingFile(str(tmp_path), max_bytes=10)
+    stored.write(b'hello ')
+    stored.write(b'text')
+    digest, path = stored.commit('.txt')
+    assert digest == hashlib.sha256(b'hello text').hexdigest()
+    assert path == str(tmp_path / f'{digest}.txt')
+
+    too_big = HashingFile(str(tmp_path), max_bytes=10)
+    too_big.write(b'hello ')
+    with pytest.raises(RequestEntityTooLarge):
+        too_big.write(b'world')
+    assert not os.path.exists(too_big.path)
+
+def test_identical_uploads_are_stored_once(tmp_path):
+    first = store_upload(FileStorage(io.BytesIO(b'same bytes'), filename='notes.PDF'), str(tmp_path))
+    second = store_upload(FileStorage(io.BytesIO(b'same bytes'), filename='copy.pdf'), str(tmp_path))
+
+    assert first == second
+    assert first[1].endswith('.pdf')
+    assert os.listdir(tmp_path) == [os.path.basename(first[1])]
@@ -0,0 +1,97 @@
+import os
+import re
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+MIN_SEGMENT_CHARS = 40
+# Synthesized segments (see segment_filename) and their temporaries
+SEGMENT_FILE_PATTERN = re.compile(r'^tts_[0-9a-f]{40}\.mp3(?:\.\d+\.\d+\.tmp)?$')
+
+# One frame of silent 128 kbps / 44.1 kHz MPEG-1 Layer III audio
+SILENT_MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+def _gtts_backend(text, lang, path):
+    from gtts import gTTS
+    gTTS(text=text, lang=lang).save(path)
+
+def _stub_backend(text, lang, path):
+    with open(path, 'wb') as f:
+        f.write(SILENT_MP3_FRAME * max(1, len(text) // 15))
+
+_backends = {
+    'gtts': _gtts_backend,
+    'stub': _stub_backend,
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('TTS_WORKERS', 4)),
+    thread_name_prefix='tts'
+)
+
+def register_backend(name, synthesize):
+    """
+    Register a TTS engine: synthesize(text, lang, path) must write an mp3 to path
+    """
+    _backends[name] = synthesize
+
+def get_backend():
+    name = os.getenv('TTS_BACKEND', 'gtts')
+    if name not in _backends:
+        raise ValueError(f"Unknown TTS backend: {name}")
+    return _backends[name]
+
+def split_sentences(text):
+    """
+    Split text into sentences, merging very short ones into their neighbour
+    """
+    segments = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if segments and len(segments[-1]) < MIN_SEGMENT_CHARS:
+            segments[-1] = f"{segments[-1]} {sentence}"
+        else:
+            segments.append(sentence)
+    return segments
+
+def segment_filename(text, lang):
+    digest = hashlib.sha1(f"{lang}\0{text}".encode('utf-8')).hexdigest()
+    return f"tts_{digest}.mp3"
+
+def synthesize(text, lang, audio_folder):
+    """
+    Synthesize one segment, reusing the cached file for the same (text, lang).
+    Reused files are touched so age-based cleanup counts from their last use
+    """
+    filename = segment_filename(text, lang)
+    path = os.path.join(audio_folder, filename)
+    if os.path.exists(path):
+        try:
+            os.utime(path, None)
+            return filename
+        except OSError:
+            pass
+
+    tmp_path = f"{path}.{os.getpid()}.{id(text)}.tmp"
+    get_backend()(text, lang, tmp_path)
+    os.replace(tmp_path, path)
+    return filename
+
+async def iter_segments(text, audio_folder, lang='en'):
+    """
+    Synthesize every sentence on the worker pool, yielding segment
+    filenames in reading order as soon as each one is ready
+    """
+    futures = [
+        _executor.submit(synthesize, sentence, lang, audio_folder)
+        for sentence in split_sentences(text)
+    ]
+    try:
+        for future in futures:
+            yield await asyncio.wrap_future(future)
+    finally:
+        for future in futures:
+            future.cancel()
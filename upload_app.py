@@ -2,51 +2,96 @@ import re
 import os
 import uuid
 import json
-import numpy as np 
+import time
+import asyncio
+import logging
+import threading
 from flask import Flask, request, jsonify, render_template, url_for, send_from_directory, session
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from gtts import gTTS
-from transformers import pipeline
-import pdf2image
-import pytesseract
-import docx
-import pptx
-import google.generativeai as genai
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 from dotenv import load_dotenv
-from PIL import Image
-from sentence_transformers import SentenceTransformer, util
-import pickle
-import base64
-from io import BytesIO
-import os.path
-
-from document_utils import store_document_data, get_document_data, clear_document_data
-
-app = Flask(__name__)
-CORS(app)
-
-app.secret_key = os.urandom(24)
-
-UPLOAD_FOLDER = 'uploads'
-AUDIO_FOLDER = os.path.join('static', 'audio_files')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(AUDIO_FOLDER, exist_ok=True)
-
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['AUDIO_FOLDER'] = AUDIO_FOLDER
-
-load_dotenv()
-api_key = os.getenv('GOOGLE_API_KEY')
-app.config['GOOGLE_API_KEY'] = api_key
-
-if not api_key:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables")
-
-genai.configure(api_key=api_key)
+from concurrent.futures import ThreadPoolExecutor
+
+from document_utils import store_document_data, clear_document_data, collect_garbage, document_key
+from retrieval_utils import embed_blocks, store_index, clear_index
+from ocr_utils import default_workers
+from extract_utils import extract_blocks, blocks_text, SUPPORTED_EXTENSIONS
+from upload_cache import get_cached_result, store_cached_result, evict
+from upload_store import UploadRequest, store_upload, discard_uploads, batch_digest, sweep_expired, UPLOAD_FILE_PATTERN
+from job_utils import JobStore, QueueFullError
+from model_registry import get_sentence_model, configure_models, warm_up, diagnostics, is_warm
+from quiz_utils import reset_questions, parse_quiz_items
+from quiz_bank import request_refill, serve, serve_stream, MIXED
+from tts_utils import iter_segments, SEGMENT_FILE_PATTERN
+from stream_utils import sse_event
+from prompt_utils import fit_document, record_prompt, prompt_stats
+from llm_client import init_llm_client
+from backend_limits import configure_limits
+from metrics import timed, register_metrics
+from asgi_app import AsyncResponse, event_stream
+from async_utils import iter_blocking
+from avatar_flask_routes import register_avatar_routes
 
-qa_model = pipeline("question-answering")
-similarity_model = SentenceTransformer('all-MiniLM-L6-v2')
+logger = logging.getLogger(__name__)
+
+UPLOAD_STAGES = ('extract', 'explain', 'tts', 'quiz')
+
+def configure(app):
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['AUDIO_FOLDER'] = os.path.join('static', 'audio_files')
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['AUDIO_FOLDER'], exist_ok=True)
+
+    app.secret_key = os.getenv('SECRET_KEY') or os.urandom(24)
+    app.config['GOOGLE_API_KEY'] = os.getenv('GOOGLE_API_KEY')
+
+    app.config['RAG_CHUNK_SIZE'] = int(os.getenv('RAG_CHUNK_SIZE', 200))
+    app.config['RAG_CHUNK_OVERLAP'] = int(os.getenv('RAG_CHUNK_OVERLAP', 40))
+    app.config['RAG_TOP_K'] = int(os.getenv('RAG_TOP_K', 4))
+    app.config['RAG_FULL_TEXT_MAX_WORDS'] = int(os.getenv('RAG_FULL_TEXT_MAX_WORDS', 600))
+    app.config['OCR_DPI'] = int(os.getenv('OCR_DPI', 200))
+    app.config['OCR_WORKERS'] = int(os.getenv('OCR_WORKERS', default_workers()))
+    app.config['EXTRACT_MAX_BYTES'] = int(os.getenv('EXTRACT_MAX_BYTES', 5 * 1024 * 1024))
+    app.config['UPLOAD_CACHE_MAX_BYTES'] = int(os.getenv('UPLOAD_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+    app.config['UPLOAD_CACHE_MAX_AGE'] = int(os.getenv('UPLOAD_CACHE_MAX_AGE', 7 * 24 * 3600))
+    app.config['UPLOAD_MAX_BYTES'] = int(os.getenv('UPLOAD_MAX_BYTES', 50 * 1024 * 1024))
+    app.config['UPLOAD_BATCH_MAX_FILES'] = int(os.getenv('UPLOAD_BATCH_MAX_FILES', 10))
+    app.config['UPLOAD_MAX_AGE'] = int(os.getenv('UPLOAD_MAX_AGE', 24 * 3600))
+    app.config['AUDIO_MAX_AGE'] = int(os.getenv('AUDIO_MAX_AGE', 7 * 24 * 3600))
+    app.config['MAX_CONTENT_LENGTH'] = app.config['UPLOAD_MAX_BYTES'] * app.config['UPLOAD_BATCH_MAX_FILES'] + 1024 * 1024
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))
+    app.config['JOB_MAX_PENDING'] = int(os.getenv('JOB_MAX_PENDING', 16))
+    app.config['MODEL_WARMUP'] = os.getenv('MODEL_WARMUP', '0') == '1'
+    app.config['HISTORY_BACKEND'] = os.getenv('HISTORY_BACKEND', 'memory')
+    app.config['HISTORY_DB'] = os.getenv('HISTORY_DB', os.path.join('session_data', 'history.db'))
+    app.config['HISTORY_TTL'] = int(os.getenv('HISTORY_TTL', 3600))
+    app.config['HISTORY_MAX_SESSIONS'] = int(os.getenv('HISTORY_MAX_SESSIONS', 1000))
+    app.config['DOCUMENT_MAX_AGE'] = int(os.getenv('DOCUMENT_MAX_AGE', 7 * 24 * 3600))
+    app.config['CONTEXT_WATCH_TIMEOUT'] = int(os.getenv('CONTEXT_WATCH_TIMEOUT', 25))
+    app.config['STT_TIMEOUT'] = float(os.getenv('STT_TIMEOUT', 5))
+    app.config['CHAT_MAX_BYTES'] = int(os.getenv('CHAT_MAX_BYTES', 10 * 1024 * 1024))
+    app.config['STT_MAX_CONCURRENCY'] = int(os.getenv('STT_MAX_CONCURRENCY', 16))
+    app.config['EMBED_MAX_CONCURRENCY'] = int(os.getenv('EMBED_MAX_CONCURRENCY', 2))
+    app.config['EMBED_BACKEND'] = os.getenv('EMBED_BACKEND', 'torch')
+    app.config['EMBED_ONNX_FILE'] = os.getenv('EMBED_ONNX_FILE', '')
+    app.config['EMBED_CACHE_SIZE'] = int(os.getenv('EMBED_CACHE_SIZE', 10000))
+    app.config['EMBED_MAX_BATCH'] = int(os.getenv('EMBED_MAX_BATCH', 64))
+    app.config['EMBED_MAX_WAIT_MS'] = float(os.getenv('EMBED_MAX_WAIT_MS', 2))
+    app.config['PROMPT_TOKEN_BUDGET'] = int(os.getenv('PROMPT_TOKEN_BUDGET', 8000))
+    app.config['PROMPT_STRATEGY'] = os.getenv('PROMPT_STRATEGY', 'trim')
+    app.config['LLM_BACKEND'] = os.getenv('LLM_BACKEND', 'gemini')
+    app.config['LLM_MODEL'] = os.getenv('LLM_MODEL', 'models/gemini-2.0-flash')
+    app.config['LLM_TIMEOUT'] = float(os.getenv('LLM_TIMEOUT', 60))
+    app.config['LLM_MAX_CONCURRENCY'] = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+    app.config['LLM_RETRIES'] = int(os.getenv('LLM_RETRIES', 2))
+    app.config['LLM_CACHE_SIZE'] = int(os.getenv('LLM_CACHE_SIZE', 128))
+    app.config['LLM_STUB_LATENCY'] = float(os.getenv('LLM_STUB_LATENCY', 0))
+    app.config['QUIZ_BATCH_SIZE'] = int(os.getenv('QUIZ_BATCH_SIZE', 5))
+    app.config['QUIZ_BANK_LOW_WATER'] = int(os.getenv('QUIZ_BANK_LOW_WATER', 10))
+    app.config['ANSWER_CACHE_THRESHOLD'] = float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.92))
+    app.config['ANSWER_CACHE_SIZE'] = int(os.getenv('ANSWER_CACHE_SIZE', 200))
+    app.config['ANSWER_CACHE_DOCUMENTS'] = int(os.getenv('ANSWER_CACHE_DOCUMENTS', 256))
 
 def clean_text(text):
     cleaned_text = re.sub(r'\*+|[_~`^]', '', text)
@@ -54,104 +99,20 @@ def clean_text(text):
     cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
     return cleaned_text
 
-def extract_text(file_path):
-    lower_path = file_path.lower()
-    print("[DEBUG] Extracting text from:", lower_path)
-
-    if lower_path.endswith('.pdf'):
-        images = pdf2image.convert_from_path(file_path)
-        text = ""
-        for image in images:
-            text += pytesseract.image_to_string(image) + "\n"
-        return text
-    elif lower_path.endswith('.docx'):
-        doc = docx.Document(file_path)
-        return "\n".join([para.text for para in doc.paragraphs])
-    elif lower_path.endswith('.pptx'):
-        presentation = pptx.Presentation(file_path)
-        text = ""
-        for slide in presentation.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + "\n"
-        return text
-    elif lower_path.endswith(('.jpg', '.jpeg', '.png', '.bmp', '.tiff')):
-        image = Image.open(file_path)
-        return pytesseract.image_to_string(image)
-    else:
-        raise ValueError("Unsupported file type")
-
-@app.route('/talk', methods=['POST'])
-def talk():
-    data = request.json
-    text = data.get('text', '')
-
-    if not text:
-        return jsonify({'error': 'No text provided'}), 400
-
-    filename = f"{uuid.uuid4().hex}.mp3"
-    filepath = os.path.join(AUDIO_FOLDER, filename)
-
-    tts = gTTS(text)
-    tts.save(filepath)
-
-    return jsonify({
-        'audio_url': f'/static/audio/{filename}',
-        'blendData': text
-    })
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/get_session_data', methods=['GET'])
-def get_session_data():
-    return jsonify({
-        'extracted_text': session.get('extracted_content', ''),
-        'explanation': session.get('explanation', ''),
-        'audio_file': session.get('audio_file', ''),
-        'quiz': session.get('quiz', ''),
-        'has_processed_file': 'extracted_content' in session
-    })
-
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'}), 400
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'}), 400
-
-        if 'user_id' not in session:
-            session['user_id'] = str(uuid.uuid4())
-        
-        user_id = session['user_id']
-        
-        clear_document_data(user_id)
-        
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-
-        print("[DEBUG] File saved:", file_path)
-
-        extracted_text = extract_text(file_path)
-        print("[DEBUG] Extracted text preview:", repr(extracted_text[:200]))
-
-        model = genai.GenerativeModel('models/gemini-2.0-flash')
-        explanation = model.generate_content(
-            f"Explain this content simply and clearly: {extracted_text}"
-        ).text.strip()
-
-        cleaned_explanation = clean_text(explanation)
-
-        unique_filename = f"{uuid.uuid4().hex}.mp3"
-        audio_path = os.path.join(app.config['AUDIO_FOLDER'], unique_filename)
-        tts = gTTS(text=cleaned_explanation, lang='en')
-        tts.save(audio_path)
-
-        quiz_prompt = f"""Content: {extracted_text}
+def extract_document(file_path, config):
+    """
+    Extract a document as (location, text) blocks plus its joined text
+    """
+    blocks = list(extract_blocks(
+        file_path,
+        dpi=config['OCR_DPI'],
+        workers=config['OCR_WORKERS'],
+        max_bytes=config['EXTRACT_MAX_BYTES']
+    ))
+    return blocks, blocks_text(blocks)
+
+def upload_quiz_prompt(document):
+    return f"""Content: {document}
 
 Generate a quiz in strict JSON:
 [
@@ -167,95 +128,52 @@ Rules:
 - Avoid repeating or paraphrasing.
 - Return only valid JSON.
 """
-        quiz_response = model.generate_content(quiz_prompt).text.strip()
 
-        if quiz_response.startswith("```json"):
-            quiz_response = quiz_response.lstrip("```json").rstrip("```").strip()
-        elif quiz_response.startswith("```"):
-            quiz_response = quiz_response.lstrip("```").rstrip("```").strip()
+TAXONOMY_EXPLANATIONS = {
+    "knowledge": "recall facts, terms, basic concepts",
+    "comprehension": "demonstrate understanding of facts and ideas",
+    "application": "apply knowledge to new situations",
+    "analysis": "examine information and break it down",
+    "evaluation": "present and defend opinions by making judgments",
+    "creation": "create new ideas or ways of viewing things"
+}
+
+FORMAT_INSTRUCTIONS = {
+    "mcq": "Create only multiple-choice questions with 4 options each",
+    "true_false": "Create only true/false questions",
+    "short_answer": "Create open-ended questions requiring short answers"
+}
+
+def quiz_instructions(difficulty_level, taxonomy_level, question_format):
+    """
+    Prompt rules for the requested difficulty, taxonomy level and format
+    """
+    taxonomy_instruction = ""
+    if taxonomy_level != "mixed" and taxonomy_level in TAXONOMY_EXPLANATIONS:
+        taxonomy_instruction = f"- Questions should focus on {taxonomy_level} level ({TAXONOMY_EXPLANATIONS[taxonomy_level]})"
+    elif taxonomy_level == "mixed":
+        taxonomy_instruction = "- Include questions covering various levels of Bloom's taxonomy (knowledge, comprehension, application, analysis, evaluation, creation)"
+
+    difficulty_instruction = ""
+    if difficulty_level != "mixed":
+        difficulty_instruction = f"- All questions should be {difficulty_level} difficulty"
+    else:
+        difficulty_instruction = "- Include a mix of easy, medium, and hard difficulty questions"
 
-        doc_data = {
-            "extracted_content": extracted_text,
-            "explanation": cleaned_explanation,
-            "quiz": quiz_response
-        }
-        
-        store_document_data(user_id, doc_data)
-        
-        session['has_document'] = True
-        session['audio_file'] = url_for('static', filename=f'audio_files/{unique_filename}')
-        
-        print("[DEBUG] Document data saved to filesystem for user:", user_id)
+    format_instruction = ""
+    if question_format != "mixed" and question_format in FORMAT_INSTRUCTIONS:
+        format_instruction = f"- {FORMAT_INSTRUCTIONS[question_format]}"
+    elif question_format == "mixed":
+        format_instruction = "- Include a mix of multiple-choice, true/false, and short-answer questions"
 
-        return jsonify({
-            'extracted_text': extracted_text,
-            'explanation': cleaned_explanation,
-            'audio_file': url_for('static', filename=f'audio_files/{unique_filename}'),
-            'quiz': quiz_response,
-            'avatar_video': ''
-        })
+    return difficulty_instruction, taxonomy_instruction, format_instruction
 
-    except Exception as e:
-        print("UPLOAD ERROR:", str(e))
-        return jsonify({'error': f"Server Error: {str(e)}"}), 500
-
-@app.route('/generate_quiz', methods=['POST'])
-def generate_quiz():
-    try:
-        data = request.get_json()
-        extracted_text = data.get("extracted_text", "")
-        if not extracted_text:
-            return jsonify({"error": "No extracted text provided"}), 400
-
-        previous_questions = data.get("previous_questions", [])
-        
-        difficulty_level = data.get("difficulty", "mixed") 
-        taxonomy_level = data.get("taxonomy", "mixed")  
-        question_format = data.get("format", "mixed") 
-        
-        similarity_model = SentenceTransformer('all-MiniLM-L6-v2')
-        
-        if previous_questions:
-            previous_embeddings = similarity_model.encode(previous_questions)
-        else:
-            previous_embeddings = np.array([])
-        
-        model = genai.GenerativeModel('models/gemini-2.0-flash')
-
-        taxonomy_explanations = {
-            "knowledge": "recall facts, terms, basic concepts",
-            "comprehension": "demonstrate understanding of facts and ideas",
-            "application": "apply knowledge to new situations",
-            "analysis": "examine information and break it down",
-            "evaluation": "present and defend opinions by making judgments",
-            "creation": "create new ideas or ways of viewing things"
-        }
-        
-        format_instructions = {
-            "mcq": "Create only multiple-choice questions with 4 options each",
-            "true_false": "Create only true/false questions",
-            "short_answer": "Create open-ended questions requiring short answers"
-        }
-        
-        taxonomy_instruction = ""
-        if taxonomy_level != "mixed" and taxonomy_level in taxonomy_explanations:
-            taxonomy_instruction = f"- Questions should focus on {taxonomy_level} level ({taxonomy_explanations[taxonomy_level]})"
-        elif taxonomy_level == "mixed":
-            taxonomy_instruction = "- Include questions covering various levels of Bloom's taxonomy (knowledge, comprehension, application, analysis, evaluation, creation)"
-            
-        difficulty_instruction = ""
-        if difficulty_level != "mixed":
-            difficulty_instruction = f"- All questions should be {difficulty_level} difficulty"
-        else:
-            difficulty_instruction = "- Include a mix of easy, medium, and hard difficulty questions"
-            
-        format_instruction = ""
-        if question_format != "mixed" and question_format in format_instructions:
-            format_instruction = f"- {format_instructions[question_format]}"
-        elif question_format == "mixed":
-            format_instruction = "- Include a mix of multiple-choice, true/false, and short-answer questions"
+def quiz_prompt(document, difficulty_instruction, taxonomy_instruction, format_instruction, existing_questions=()):
+    avoid_instruction = ""
+    if existing_questions:
+        avoid_instruction = "- Do not repeat or paraphrase any of these existing questions: " + "; ".join(existing_questions)
 
-        prompt = f"""Content: {extracted_text}
+    return f"""Content: {document}
 
 Generate a quiz in strict JSON format:
 [
@@ -274,6 +192,7 @@ Important:
 {difficulty_instruction}
 {taxonomy_instruction}
 {format_instruction}
+{avoid_instruction}
 - Create diverse questions covering different concepts from the content
 - Ensure questions test different aspects of understanding
 - Create questions that differ substantially from each other
@@ -282,65 +201,491 @@ Important:
 - Return valid JSON only.
 """
 
-        quiz_response = model.generate_content(prompt).text.strip()
+def register_upload_routes(app, llm):
+    job_store = JobStore(
+        max_workers=app.config['JOB_WORKERS'],
+        max_pending=app.config['JOB_MAX_PENDING']
+    )
+    stage_executor = ThreadPoolExecutor(
+        max_workers=app.config['JOB_WORKERS'] * 2,
+        thread_name_prefix='stage'
+    )
+
+    def audio_url(filename):
+        return f"{app.static_url_path}/audio_files/{filename}"
+
+    def summarize_chunk(chunk):
+        prompt = record_prompt(
+            'summarize',
+            f"Summarize the key facts, terms and ideas in this excerpt so it can be used to explain the material and write quiz questions:\n\n{chunk}"
+        )
+        return llm.generate(prompt, cache=True).strip()
+
+    def fit_prompt_document(extracted_text):
+        return fit_document(
+            extracted_text,
+            app.config['PROMPT_TOKEN_BUDGET'],
+            strategy=app.config['PROMPT_STRATEGY'],
+            summarize=summarize_chunk
+        )
+
+    def explain_document(document):
+        explanation = llm.generate(record_prompt(
+            'explain', f"Explain this content simply and clearly: {document}"
+        ), cache=True).strip()
+
+        return clean_text(explanation)
+
+    def synthesize_explanation(cleaned_explanation, job):
+        audio_segments = []
+        for filename in iter_blocking(iter_segments(cleaned_explanation, app.config['AUDIO_FOLDER'], lang='en')):
+            audio_segments.append(filename)
+            job.add_results(
+                audio_file=audio_url(audio_segments[0]),
+                audio_segments=[audio_url(name) for name in audio_segments]
+            )
+
+        return audio_segments
+
+    def generate_document_quiz(document, job):
+        """
+        The upload quiz as a JSON array. If generation fails, the questions
+        written so far are kept so the rest of the upload is still published
+        """
+        quiz_items = []
+        prompt = record_prompt('upload_quiz', upload_quiz_prompt(document))
+        try:
+            for item in iter_blocking(parse_quiz_items(llm.stream(prompt))):
+                quiz_items.append(item)
+                job.add_results(quiz=json.dumps(quiz_items))
+        except Exception:
+            logger.exception("Upload quiz failed after %d questions", len(quiz_items))
+
+        return json.dumps(quiz_items)
+
+    def bank_quiz_prompt(extracted_text, filters, existing_questions=()):
+        return record_prompt('generate_quiz', quiz_prompt(
+            fit_prompt_document(extracted_text),
+            *quiz_instructions(filters['difficulty'], filters['taxonomy_level'], filters['format']),
+            existing_questions=existing_questions
+        ))
+
+    def tag_question(item, filters):
+        for tag, value in filters.items():
+            if value != 'mixed' and not item.get(tag):
+                item[tag] = value
+        return item
+
+    async def generate_bank_questions(extracted_text, filters, existing_questions=()):
+        prompt = await asyncio.to_thread(bank_quiz_prompt, extracted_text, filters, existing_questions)
+
+        items = parse_quiz_items(llm.stream(prompt))
+        try:
+            with timed('quiz'):
+                async for item in items:
+                    yield tag_question(item, filters)
+        finally:
+            await items.aclose()
+
+    def question_generator(extracted_text):
+        return lambda filters, existing: generate_bank_questions(extracted_text, filters, existing)
+
+    def extract_uploads(uploads):
+        """
+        Extract (filename, path) uploads into one document. Files of a batch
+        are extracted concurrently and their block locations name the file
+        """
+        if len(uploads) == 1:
+            return extract_document(uploads[0][1], app.config)
+
+        extracted = stage_executor.map(lambda upload: extract_document(upload[1], app.config), uploads)
+        blocks = []
+        for (filename, _), (file_blocks, _) in zip(uploads, extracted):
+            blocks.extend((f"{filename} {location}".strip(), text) for location, text in file_blocks)
+        return blocks, blocks_text(blocks)
+
+    def process_document(uploads, job):
+        started = time.perf_counter()
+
+        job.start_stage('extract')
+        blocks, extracted_text = extract_uploads(uploads)
+        logger.debug("Extracted text preview: %r", extracted_text[:200])
+        job.finish_stage('extract', extracted_text=extracted_text)
+
+        document = fit_prompt_document(extracted_text)
+
+        def explain_and_speak():
+            job.start_stage('explain')
+            cleaned_explanation = explain_document(document)
+            job.finish_stage('explain', explanation=cleaned_explanation)
+
+            job.start_stage('tts')
+            audio_segments = synthesize_explanation(cleaned_explanation, job)
+            job.finish_stage('tts')
+
+            return cleaned_explanation, audio_segments
+
+        def build_quiz():
+            job.start_stage('quiz')
+            quiz_response = generate_document_quiz(document, job)
+            job.finish_stage('quiz', quiz=quiz_response)
+
+            return quiz_response
+
+        explain_future = stage_executor.submit(explain_and_speak)
+        quiz_future = stage_executor.submit(build_quiz)
+        try:
+            cleaned_explanation, audio_segments = explain_future.result()
+            quiz_response = quiz_future.result()
+        finally:
+            quiz_future.cancel()
+
+        logger.info("Stage timings: %s total: %.3f", job.timings, time.perf_counter() - started)
+
+        return {
+            'extracted_text': extracted_text,
+            'blocks': blocks,
+            'explanation': cleaned_explanation,
+            'audio_segments': audio_segments,
+            'quiz': quiz_response
+        }
+
+    def run_upload_job(job, user_id, uploads, digest):
+        result = get_cached_result(digest, app.config['AUDIO_FOLDER'])
+        if result:
+            logger.info("Upload cache hit: %s", digest)
+            job.finish_all(
+                extracted_text=result['extracted_text'],
+                explanation=result['explanation'],
+                audio_file=audio_url(result['audio_segments'][0]) if result['audio_segments'] else '',
+                audio_segments=[audio_url(name) for name in result['audio_segments']],
+                quiz=result['quiz']
+            )
+        else:
+            result = process_document(uploads, job)
+            store_cached_result(digest, result, app.config['AUDIO_FOLDER'])
+            evict(app.config['UPLOAD_CACHE_MAX_BYTES'], app.config['UPLOAD_CACHE_MAX_AGE'])
+
+        job.check_cancelled()
+
+        extracted_text = result['extracted_text']
+        blocks = result.get('blocks') or [("", extracted_text)]
+        index = embed_blocks(
+            blocks, get_sentence_model(),
+            chunk_size=app.config['RAG_CHUNK_SIZE'],
+            overlap=app.config['RAG_CHUNK_OVERLAP']
+        )
+        logger.debug("Indexed chunks: %d", len(index[0]))
 
-        if quiz_response.startswith("```json"):
-            quiz_response = quiz_response.lstrip("```json").rstrip("```").strip()
-        elif quiz_response.startswith("```"):
-            quiz_response = quiz_response.lstrip("```").rstrip("```").strip()
+        doc_data = {
+            "extracted_content": extracted_text,
+            "explanation": result['explanation'],
+            "quiz": result['quiz']
+        }
 
         try:
-            quiz_data = json.loads(quiz_response)
-        except json.JSONDecodeError as e:
-            return jsonify({"error": f"Gemini returned invalid JSON: {str(e)}", "raw_response": quiz_response}), 500
-
-        unique_quiz = []
-        seen_questions = set()
-        
-        def is_semantically_similar(new_question, prev_embeddings, threshold=0.85):
-            if not isinstance(prev_embeddings, np.ndarray) or prev_embeddings.size == 0:  
-                return False
-                
-            new_embedding = similarity_model.encode([new_question])[0]
-            
-            similarities = util.pytorch_cos_sim(new_embedding, prev_embeddings)[0]
-            
-            return any(sim.item() > threshold for sim in similarities)
-
-        for item in quiz_data:
-            question_text = item.get("question", "").strip()
-            
-            if not question_text or question_text.lower() in seen_questions:
-                continue
-                
-            if isinstance(previous_embeddings, np.ndarray) and previous_embeddings.size > 0 and is_semantically_similar(question_text, previous_embeddings):
-                print(f"Skipping semantically similar question: {question_text}")
-                continue
-                
-            seen_questions.add(question_text.lower())
-            unique_quiz.append(item)
-            
-            new_embedding = similarity_model.encode([question_text])
-            if isinstance(previous_embeddings, np.ndarray) and previous_embeddings.size > 0:
-                previous_embeddings = np.vstack([previous_embeddings, new_embedding])
-            else:
-                previous_embeddings = new_embedding
-
-        if not unique_quiz:
-            return jsonify({"error": "No new quiz questions could be generated."}), 400
-
-        return jsonify({"quiz": json.dumps(unique_quiz)})
-
-    except Exception as e:
-        print("QUIZ GENERATION ERROR:", str(e))
-        return jsonify({'error': f"Quiz Generation Failed: {str(e)}"}), 500
-    
-@app.route('/uploads/<path:filename>', methods=['GET'])
-def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+            quiz_questions = [item.get("question", "") for item in json.loads(result['quiz'])]
+        except (ValueError, TypeError, AttributeError):
+            quiz_questions = []
 
-from avatar_flask_routes import register_avatar_routes
-register_avatar_routes(app)
+        with job_store.publishing(job):
+            store_index(user_id, index)
+            store_document_data(user_id, doc_data)
+            reset_questions(user_id, quiz_questions)
+
+        collect_garbage(app.config['DOCUMENT_MAX_AGE'])
+        sweep_expired(app.config['UPLOAD_FOLDER'], app.config['UPLOAD_MAX_AGE'], UPLOAD_FILE_PATTERN)
+        sweep_expired(app.config['AUDIO_FOLDER'], app.config['AUDIO_MAX_AGE'], SEGMENT_FILE_PATTERN)
+        request_refill(document_key(extracted_text), question_generator(extracted_text), get_sentence_model(), MIXED)
+
+        logger.debug("Document data saved for user: %s", user_id)
+
+    @app.route('/talk', methods=['POST'])
+    def talk():
+        data = request.json
+        text = data.get('text', '')
+
+        if not text:
+            return jsonify({'error': 'No text provided'}), 400
+
+        lang = data.get('lang', 'en')
+        segments = iter_segments(text, app.config['AUDIO_FOLDER'], lang=lang)
+
+        if data.get('stream'):
+            async def events():
+                async for filename in segments:
+                    yield sse_event({'audio_url': audio_url(filename)})
+                yield sse_event({'blendData': text}, event='done')
+
+            return event_stream(events())
+
+        async def spoken():
+            with timed('tts'):
+                audio_segments = [audio_url(filename) async for filename in segments]
+
+            return jsonify({
+                'audio_url': audio_segments[0] if audio_segments else '',
+                'audio_segments': audio_segments,
+                'blendData': text
+            })
+
+        return AsyncResponse(reply=spoken())
+
+    @app.route('/')
+    def index():
+        return render_template('index.html')
+
+    @app.route('/get_session_data', methods=['GET'])
+    def get_session_data():
+        return jsonify({
+            'extracted_text': session.get('extracted_content', ''),
+            'explanation': session.get('explanation', ''),
+            'audio_file': session.get('audio_file', ''),
+            'quiz': session.get('quiz', ''),
+            'has_processed_file': 'extracted_content' in session
+        })
+
+    def start_upload_job(files):
+        """
+        Store the uploaded files under their content hashes and queue one job
+        that turns them into the session's document
+        """
+        try:
+            if len(files) > app.config['UPLOAD_BATCH_MAX_FILES']:
+                return jsonify({'error': f"At most {app.config['UPLOAD_BATCH_MAX_FILES']} files can be uploaded at once"}), 400
+
+            unsupported = [file.filename for file in files if not file.filename.lower().endswith(SUPPORTED_EXTENSIONS)]
+            if unsupported:
+                return jsonify({'error': f"Unsupported file type: {', '.join(unsupported)}"}), 400
+
+            if 'user_id' not in session:
+                session['user_id'] = str(uuid.uuid4())
+
+            user_id = session['user_id']
+
+            job_store.cancel_for_user(user_id)
+            with job_store.user_lock(user_id):
+                clear_document_data(user_id)
+                clear_index(user_id)
+
+            uploads = []
+            digests = []
+            for file in files:
+                digest, path = store_upload(file, app.config['UPLOAD_FOLDER'], app.config['UPLOAD_MAX_BYTES'])
+                uploads.append((secure_filename(file.filename), path))
+                digests.append(digest)
+            digest = digests[0] if len(digests) == 1 else batch_digest(digests)
+
+            try:
+                job = job_store.submit(user_id, UPLOAD_STAGES, run_upload_job, user_id, uploads, digest)
+            except QueueFullError as e:
+                return jsonify({'error': str(e)}), 503
+
+            session['has_document'] = True
+            session.pop('audio_file', None)
+
+            return jsonify({
+                'job_id': job.id,
+                'status_url': url_for('get_job', job_id=job.id)
+            }), 202
+        finally:
+            discard_uploads(files)
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def upload_too_large(e):
+        return jsonify({'error': e.description}), 413
+
+    @app.route('/upload', methods=['POST'])
+    def upload_file():
+        try:
+            with timed('save'):
+                file = request.files.get('file')
+            if file is None:
+                return jsonify({'error': 'No file part'}), 400
+            if file.filename == '':
+                discard_uploads([file])
+                return jsonify({'error': 'No selected file'}), 400
+
+            return start_upload_job([file])
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception("Upload failed")
+            return jsonify({'error': f"Server Error: {str(e)}"}), 500
+
+    @app.route('/upload/batch', methods=['POST'])
+    def upload_batch():
+        """
+        Upload several files at once; they are extracted concurrently and
+        combined into a single document for explanation, quiz and chat
+        """
+        try:
+            with timed('save'):
+                files = request.files.getlist('files')
+            discard_uploads([file for file in files if not file.filename])
+            files = [file for file in files if file.filename]
+            if not files:
+                return jsonify({'error': 'No selected files'}), 400
+
+            return start_upload_job(files)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception("Batch upload failed")
+            return jsonify({'error': f"Server Error: {str(e)}"}), 500
+
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = job_store.get(job_id)
+        if job is None or job.user_id != session.get('user_id'):
+            return jsonify({'error': 'Job not found'}), 404
+
+        data = job.to_dict()
+        if job.status == 'completed':
+            session['audio_file'] = data['results'].get('audio_file', '')
+            data['results']['avatar_video'] = ''
+
+        return jsonify(data)
+
+    @app.route('/jobs/<job_id>', methods=['DELETE'])
+    def cancel_job(job_id):
+        job = job_store.get(job_id)
+        if job is None or job.user_id != session.get('user_id'):
+            return jsonify({'error': 'Job not found'}), 404
+
+        if not job_store.cancel(job_id):
+            return jsonify({'error': 'Job has already finished'}), 409
+
+        return jsonify(job.to_dict())
+
+    def quiz_filters(data):
+        return {
+            'difficulty': data.get("difficulty", "mixed"),
+            'taxonomy_level': data.get("taxonomy", "mixed"),
+            'format': data.get("format", "mixed")
+        }
+
+    @app.route('/generate_quiz', methods=['POST'])
+    def generate_quiz():
+        try:
+            data = request.get_json()
+            extracted_text = data.get("extracted_text", "")
+            if not extracted_text:
+                return jsonify({"error": "No extracted text provided"}), 400
+
+            previous_questions = data.get("previous_questions", [])
+            filters = quiz_filters(data)
+
+            if 'user_id' not in session:
+                session['user_id'] = str(uuid.uuid4())
+
+            if data.get('stream'):
+                questions = serve_stream(
+                    document_key(extracted_text), session['user_id'],
+                    question_generator(extracted_text), get_sentence_model(), filters,
+                    count=app.config['QUIZ_BATCH_SIZE'],
+                    low_water=app.config['QUIZ_BANK_LOW_WATER'],
+                    previous_questions=previous_questions
+                )
+
+                async def events():
+                    sent = 0
+                    try:
+                        async for question in questions:
+                            sent += 1
+                            yield sse_event(question, event='question')
+                    except Exception as e:
+                        logger.exception("Quiz generation failed")
+                        yield sse_event({'error': f"Quiz Generation Failed: {str(e)}"}, event='error')
+                        return
+                    finally:
+                        await questions.aclose()
+                    if not sent:
+                        yield sse_event({'error': "No new quiz questions could be generated."}, event='error')
+                        return
+                    yield sse_event({'count': sent}, event='done')
+
+                return event_stream(events())
+
+            unique_quiz = serve(
+                document_key(extracted_text), session['user_id'],
+                question_generator(extracted_text), get_sentence_model(), filters,
+                count=app.config['QUIZ_BATCH_SIZE'],
+                low_water=app.config['QUIZ_BANK_LOW_WATER'],
+                previous_questions=previous_questions
+            )
+
+            if not unique_quiz:
+                return jsonify({"error": "No new quiz questions could be generated."}), 400
+
+            return jsonify({"quiz": json.dumps(unique_quiz)})
+
+        except Exception as e:
+            logger.exception("Quiz generation failed")
+            return jsonify({'error': f"Quiz Generation Failed: {str(e)}"}), 500
+
+    @app.route('/diagnostics/models', methods=['GET'])
+    def model_diagnostics():
+        return jsonify(diagnostics())
+
+    @app.route('/diagnostics/prompts', methods=['GET'])
+    def prompt_diagnostics():
+        return jsonify(prompt_stats())
+
+    @app.route('/uploads/<path:filename>', methods=['GET'])
+    def uploaded_file(filename):
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+
+def register_health_routes(app):
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        """
+        Liveness: the process is up and serving requests
+        """
+        return jsonify({'status': 'serving'})
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        """
+        Readiness: with MODEL_WARMUP set, report 503 until every model is loaded
+        """
+        warm = is_warm()
+        ready = warm or not app.config['MODEL_WARMUP']
+        return jsonify({
+            'status': 'ready' if ready else 'warming',
+            'models_warm': warm
+        }), 200 if ready else 503
+
+def create_app():
+    """
+    Build the Flask app. Heavy libraries (OCR, document parsers, speech
+    recognition, Gemini, sentence-transformers) are imported on first use
+    """
+    load_dotenv()
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    CORS(app)
+    configure(app)
+    configure_limits(app.config)
+    configure_models(app.config)
+
+    llm = init_llm_client(app.config)
+    register_upload_routes(app, llm)
+    register_avatar_routes(app)
+    register_health_routes(app)
+    register_metrics(app)
+
+    if app.config['MODEL_WARMUP']:
+        threading.Thread(target=warm_up, name='model-warmup', daemon=True).start()
+
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    create_app().run(debug=True, port=5000)
@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import threading
+
+CACHE_DIR = 'upload_cache'
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+_lock = threading.Lock()
+
+def _entry_path(digest):
+    return os.path.join(CACHE_DIR, f"{digest}.json")
+
+def get_cached_result(digest, audio_folder):
+    """
+    Return the cached pipeline result for a digest, or None on a miss.
+    Entries whose audio segments have disappeared are dropped. The
+    segments of a hit are touched so the audio sweep counts from their
+    last use
+    """
+    path = _entry_path(digest)
+    with _lock:
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            _remove_entry(path)
+            return None
+
+        segments = entry.get('audio_segments')
+        if segments is None or not all(os.path.exists(os.path.join(audio_folder, name)) for name in segments):
+            _remove_entry(path)
+            return None
+
+        os.utime(path, None)
+        for name in segments:
+            try:
+                os.utime(os.path.join(audio_folder, name), None)
+            except OSError:
+                pass
+        return entry
+
+def store_cached_result(digest, result, audio_folder):
+    """
+    Cache the pipeline result for a digest; result must name the audio
+    segments already saved in audio_folder
+    """
+    entry = dict(result)
+    entry['created_at'] = time.time()
+
+    path = _entry_path(digest)
+    tmp_path = path + '.tmp'
+    with _lock:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+def _remove_entry(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def evict(max_bytes, max_age):
+    """
+    Drop entries older than max_age seconds, then least recently used
+    entries until their metadata fits in max_bytes. Audio segments are
+    shared with other entries and /talk, so they are left to the age
+    sweep of the audio folder
+    """
+    now = time.time()
+    entries = []
+
+    with _lock:
+        for name in os.listdir(CACHE_DIR):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                _remove_entry(path)
+                continue
+
+            if now - entry.get('created_at', 0) > max_age:
+                _remove_entry(path)
+                continue
+
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+
+        total = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            _remove_entry(path)
+            total -= size
@@ -0,0 +1,125 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = '.part'
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_ENDPOINTS = ('upload_file', 'upload_batch')
+# Stored uploads (<sha256><ext>) and HashingFile temporaries
+UPLOAD_FILE_PATTERN = re.compile(r'^(?:[0-9a-f]{64}(?:\.\w+)?|tmp\w+\.part)$')
+
+class HashingFile:
+    """
+    Temporary file in the upload folder that hashes everything written to
+    it and refuses to grow past max_bytes. commit() moves it to its
+    content address, so the bytes are read off the wire exactly once
+    """
+    def __init__(self, upload_folder, max_bytes=None):
+        fd, self.path = tempfile.mkstemp(dir=upload_folder, suffix=PART_SUFFIX)
+        self.file = os.fdopen(fd, 'w+b')
+        self.upload_folder = upload_folder
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            self.discard()
+            raise RequestEntityTooLarge(f"Each file must be at most {round(self.max_bytes / (1024 * 1024), 1):g} MB")
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def commit(self, extension=''):
+        """
+        Move the file to <sha256><extension> and return (digest, path).
+        Identical uploads end up at the same path
+        """
+        self.file.close()
+        digest = self.sha256.hexdigest()
+        path = os.path.join(self.upload_folder, digest + extension)
+        os.replace(self.path, path)
+        return digest, path
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+class UploadRequest(Request):
+    """
+    Request that streams the file parts of upload requests straight into
+    HashingFiles instead of Werkzeug's spooled temporary files
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in UPLOAD_ENDPOINTS:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return HashingFile(current_app.config['UPLOAD_FOLDER'], current_app.config['UPLOAD_MAX_BYTES'])
+
+def store_upload(file, upload_folder, max_bytes=None):
+    """
+    Save an uploaded FileStorage under its SHA-256 and return (digest, path).
+    Files parsed by UploadRequest are already hashed on disk and are just
+    moved into place; anything else is copied through a HashingFile
+    """
+    stream = file.stream
+    if not isinstance(stream, HashingFile):
+        stream = HashingFile(upload_folder, max_bytes)
+        for block in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+            stream.write(block)
+
+    extension = os.path.splitext(secure_filename(file.filename or ''))[1].lower()
+    digest, path = stream.commit(extension)
+    logger.debug("Stored upload %s (%d bytes) as %s", file.filename, stream.size, path)
+    return digest, path
+
+def discard_uploads(files):
+    """
+    Remove the temporary files of uploads that were never stored
+    """
+    for file in files:
+        if isinstance(file.stream, HashingFile) and not file.stream.file.closed:
+            file.stream.discard()
+
+def batch_digest(digests):
+    """
+    Cache key for a batch of files, independent of upload order
+    """
+    return hashlib.sha256("\0".join(sorted(digests)).encode('ascii')).hexdigest()
+
+def sweep_expired(folder, max_age, pattern):
+    """
+    Delete files in folder whose names match pattern and that were not
+    modified for max_age seconds. Only files this app creates should
+    match, so tracked files such as .gitignore are never touched
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(folder):
+        if name.startswith('.') or not pattern.match(name):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+
+    if removed:
+        logger.info("Removed %d expired files from %s", removed, folder)
+    return removed